@@ -0,0 +1,78 @@
+"""
+/***************************************************************************
+ pharmaceuticals - synthetic input generator
+
+ Writes synthetic input csv files in the same layout of
+ documentation/example_application/input_csv_file.csv (fields delimited by ;,
+ date and time as YYYY-mm-dd hh:mm:ss), with any number of rows and of
+ compounds, for benchmarks:
+
+ python benchmarks/generate_input.py output.csv --rows 1000000 --compounds 10
+
+ Rows are generated and written a chunk at a time, so that files of any size
+ (also 10^8 rows) can be written with little memory.
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import argparse
+import sys
+
+import numpy
+
+#Headers of the fields of sample ID, date and time and velocity
+ID_FIELD='Sample ID'
+TIME_FIELD='Date and Time'
+VELOCITY_FIELD='Avg velocity (m/s)'
+
+#Number of rows generated at a time
+CHUNK_ROWS=100000
+
+#The compound_fields function returns the headers of the fields of the
+#concentrations of the given number of compounds
+def compound_fields(compounds):
+
+    return ['Diclofenac (ng/l)']+['Compound %d (ng/l)' % number for number in range(2, compounds+1)]
+
+#The generate_input function writes a synthetic input csv file with the given
+#number of rows and of compounds (the same seed gives the same file).
+#Samples are taken every 10 minutes from 2018-01-01 00:00:00, velocities are
+#between 0.01 and 0.05 m/s and concentrations between 100 and 500 ng/l
+def generate_input(path, rows, compounds=1, seed=0):
+
+    rng=numpy.random.default_rng(seed)
+    start=numpy.datetime64('2018-01-01T00:00:00')
+    with open(path, 'w', newline='') as outputfile:
+        outputfile.write(';'.join([ID_FIELD, TIME_FIELD, VELOCITY_FIELD]+compound_fields(compounds))+'\n')
+        for first in range(0, rows, CHUNK_ROWS):
+            number=numpy.arange(first, min(rows, first+CHUNK_ROWS))
+            date_time=start+(number*600).astype('timedelta64[s]')
+            columns=[(number+1).astype(str),
+                     numpy.char.replace(numpy.datetime_as_string(date_time), 'T', ' '),
+                     rng.uniform(0.01, 0.05, len(number)).round(4).astype(str)]
+            for _ in range(compounds):
+                columns.append(rng.uniform(100, 500, len(number)).round(1).astype(str))
+            outputfile.write('\n'.join(map(';'.join, zip(*columns)))+'\n')
+
+def main(argv=None):
+
+    parser=argparse.ArgumentParser(description='Write a synthetic input csv file.')
+    parser.add_argument('output', help='output csv file')
+    parser.add_argument('--rows', type=int, default=1000, help='number of rows (default: %(default)s)')
+    parser.add_argument('--compounds', type=int, default=1, help='number of compounds (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random values (default: %(default)s)')
+    args=parser.parse_args(argv)
+    generate_input(args.output, args.rows, args.compounds, args.seed)
+    return 0
+
+if __name__=='__main__':
+    sys.exit(main())
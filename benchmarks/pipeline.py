@@ -0,0 +1,194 @@
+"""
+/***************************************************************************
+ pharmaceuticals - pipeline benchmark
+
+ Times each stage of the pipeline of the pharmaceuticals tool on synthetic
+ input csv files (see generate_input.py) of growing size, and records the
+ peak memory allocated by each stage:
+
+ headers    -> reading the headers of the csv file
+ read       -> reading the whole csv file into columns
+ columns    -> converting the fields of velocity and concentrations into numbers
+ timestamps -> parsing date and time of measurement
+ decay      -> simulating travel times, arrival times and concentrations at the outlet
+ write      -> writing the results to a csv file
+ render     -> plotting measured and simulated concentrations to a PNG file
+ stream     -> the whole run, chunk by chunk (as python -m pharmaceuticals run)
+
+ python benchmarks/pipeline.py --rows 1000,10000,100000 --compounds 1,10
+
+ The in-memory stages (all but stream) are skipped for files larger than
+ --max-memory-rows, so that files of up to 10^8 rows can be measured with
+ the streaming stage only. Results are printed as a table and can be saved as
+ JSON (--output), to track regressions and improvements of each stage.
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+#The benchmark runs from a checkout of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_input import ID_FIELD, TIME_FIELD, VELOCITY_FIELD, compound_fields, generate_input
+
+from pharmaceuticals.engine import simulate_compounds
+from pharmaceuticals.export import write_compounds_csv
+from pharmaceuticals.reader import read_columns, read_headers
+from pharmaceuticals.streaming import simulate_file
+
+#Distance (m) and degradation rate coefficient (1/s) used by the benchmark
+DISTANCE=1000.0
+K=0.0001
+
+#The stages of the benchmark take a state (a dictionary with the paths of the
+#input and output files and the results of the stages before) and store their
+#results in it
+
+def headers_stage(state):
+
+    state['headers']=read_headers(state['input'])
+
+def read_stage(state):
+
+    state['table']=read_columns(state['input'])
+
+def columns_stage(state):
+
+    table=state['table']
+    state['velocity']=_fresh(table, VELOCITY_FIELD, 'numbers')
+    state['inlet_concs']=dict((field, _fresh(table, field, 'numbers')) for field in state['compounds'])
+
+def timestamps_stage(state):
+
+    state['date_time']=_fresh(state['table'], TIME_FIELD, 'timestamps')
+
+def decay_stage(state):
+
+    k_values=dict((field, K) for field in state['compounds'])
+    state['result']=simulate_compounds(state['inlet_concs'], state['velocity'], state['date_time'], DISTANCE, k_values)
+
+def write_stage(state):
+
+    write_compounds_csv(state['output'], _fresh(state['table'], ID_FIELD, 'strings'),
+                        state['date_time'], state['result'])
+
+def render_stage(state):
+
+    from matplotlib.figure import Figure
+    from pharmaceuticals.plotting import ResponsiveSeries
+
+    figure=Figure()
+    axes=figure.add_subplot(1, 1, 1)
+    field=state['compounds'][0]
+    ResponsiveSeries(axes, state['date_time'], state['inlet_concs'][field])
+    ResponsiveSeries(axes, state['result'].arrival_time, state['result'].outlet_conc[0])
+    figure.savefig(state['figure'])
+
+def stream_stage(state):
+
+    simulate_file(state['input'], state['output'], ID_FIELD, TIME_FIELD, VELOCITY_FIELD,
+                  state['compounds'][0], DISTANCE, K)
+
+#The _fresh function converts a field of a ColumnTable without using the
+#conversions already made (so that each conversion is timed in full)
+def _fresh(table, name, kind):
+
+    table._typed.clear()
+    return getattr(table, kind)(name)
+
+#Stages run on the whole file in memory, and stages which stream it
+MEMORY_STAGES=[('headers', headers_stage), ('read', read_stage), ('columns', columns_stage),
+               ('timestamps', timestamps_stage), ('decay', decay_stage), ('write', write_stage),
+               ('render', render_stage)]
+STREAM_STAGES=[('stream', stream_stage)]
+
+#The run_stage function runs a stage and returns its wall time (s); if memory is
+#True the stage is run again tracing memory allocations (which slows it down) and
+#the peak memory allocated (bytes) is returned too
+def run_stage(stage, state, memory):
+
+    start=time.perf_counter()
+    stage(state)
+    elapsed=time.perf_counter()-start
+    peak=None
+    if memory:
+        tracemalloc.start()
+        stage(state)
+        peak=tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, peak
+
+#The benchmark function runs all the stages on a synthetic file with the given
+#number of rows and compounds and returns a list of results (one per stage)
+def benchmark(rows, compounds, folder, memory=True, max_memory_rows=10**7):
+
+    state={'input': os.path.join(folder, 'input_%d_%d.csv' % (rows, compounds)),
+           'output': os.path.join(folder, 'output.csv'),
+           'figure': os.path.join(folder, 'figure.png'),
+           'compounds': compound_fields(compounds)}
+    start=time.perf_counter()
+    generate_input(state['input'], rows, compounds)
+    results=[{'rows': rows, 'compounds': compounds, 'stage': 'generate',
+              'seconds': time.perf_counter()-start, 'rows_per_second': None, 'peak_bytes': None}]
+
+    stages=STREAM_STAGES if rows>max_memory_rows else MEMORY_STAGES+STREAM_STAGES
+    for name, stage in stages:
+        elapsed, peak=run_stage(stage, state, memory)
+        results.append({'rows': rows, 'compounds': compounds, 'stage': name, 'seconds': elapsed,
+                        'rows_per_second': rows/elapsed if elapsed>0 else None, 'peak_bytes': peak})
+    os.remove(state['input'])
+    return results
+
+def main(argv=None):
+
+    parser=argparse.ArgumentParser(description='Time each stage of the pipeline on synthetic inputs.')
+    parser.add_argument('--rows', default='1000,10000,100000',
+                        help='comma-separated numbers of rows (default: %(default)s)')
+    parser.add_argument('--compounds', default='1',
+                        help='comma-separated numbers of compounds (default: %(default)s)')
+    parser.add_argument('--max-memory-rows', type=int, default=10**7,
+                        help='largest file run through the in-memory stages (default: %(default)s)')
+    parser.add_argument('--no-memory', action='store_true', help='do not measure the peak memory of the stages')
+    parser.add_argument('--output', help='JSON file of the results')
+    args=parser.parse_args(argv)
+
+    #Importing matplotlib before timing, so that its import is not charged to render
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.figure
+
+    results=[]
+    print('%10s %9s %-10s %10s %14s %12s' % ('rows', 'compounds', 'stage', 'seconds', 'rows/s', 'peak MB'))
+    with tempfile.TemporaryDirectory() as folder:
+        for compounds in [int(value) for value in args.compounds.split(',')]:
+            for rows in [int(float(value)) for value in args.rows.split(',')]:
+                for result in benchmark(rows, compounds, folder, not args.no_memory, args.max_memory_rows):
+                    results.append(result)
+                    print('%10d %9d %-10s %10.4f %14s %12s' % (
+                        rows, compounds, result['stage'], result['seconds'],
+                        '-' if result['rows_per_second'] is None else '%.0f' % result['rows_per_second'],
+                        '-' if result['peak_bytes'] is None else '%.1f' % (result['peak_bytes']/2**20)))
+
+    if args.output:
+        with open(args.output, 'w') as outputfile:
+            json.dump(results, outputfile, indent=1)
+    return 0
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+/***************************************************************************
+ pharmaceuticals - startup time
+
+ Measures the cold start of the Dialog (pharmaceuticals_v0.1.py): the time
+ from launching python to the Dialog shown, in a new process each time, and
+ checks it against the startup-time budget. It also checks that no heavy
+ module (numpy, matplotlib, pandas) is imported before the Dialog shows up.
+
+ python benchmarks/startup_time.py [--runs 5] [--budget 0.5] [--offscreen]
+
+ The exit status is 1 if the median startup time is over the budget or if a
+ heavy module has been imported.
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+#Startup-time budget (s) of the Dialog
+STARTUP_BUDGET=0.5
+
+#Modules which must not be imported before the Dialog shows up
+HEAVY_MODULES=['numpy', 'matplotlib', 'pandas']
+
+#Folder of pharmaceuticals_v0.1.py
+ROOT=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#Code run by each new process: it shows the Dialog, processes the pending events
+#and prints the heavy modules imported
+STARTUP_CODE='''
+import runpy, sys
+from PyQt5 import QtWidgets
+app=QtWidgets.QApplication(sys.argv)
+gui=runpy.run_path(%r, run_name='pharmaceuticals_gui')
+window=gui['MyWindow']()
+app.processEvents()
+print(' '.join(sorted(name for name in %r if name in sys.modules)))
+''' % (os.path.join(ROOT, 'pharmaceuticals_v0.1.py'), HEAVY_MODULES)
+
+#The measure_startup function returns the time (s) from the launch of a new python
+#process to the Dialog shown and the heavy modules imported meanwhile
+def measure_startup(environment):
+
+    start=time.perf_counter()
+    output=subprocess.run([sys.executable, '-c', STARTUP_CODE], cwd=ROOT, env=environment,
+                          check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return time.perf_counter()-start, output.split()
+
+def main(argv=None):
+
+    parser=argparse.ArgumentParser(description='Measure the startup time of the Dialog.')
+    parser.add_argument('--runs', type=int, default=5, help='number of launches (default: %(default)s)')
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET,
+                        help='startup-time budget, s (default: %(default)s)')
+    parser.add_argument('--offscreen', action='store_true', help='show the Dialog without a display')
+    args=parser.parse_args(argv)
+
+    environment=dict(os.environ)
+    if args.offscreen:
+        environment['QT_QPA_PLATFORM']='offscreen'
+
+    times=[]
+    heavy=set()
+    for run in range(args.runs):
+        elapsed, modules=measure_startup(environment)
+        times.append(elapsed)
+        heavy.update(modules)
+        print('run %d: %.3f s' % (run+1, elapsed))
+
+    median=statistics.median(times)
+    print('median startup time: %.3f s (budget: %.3f s)' % (median, args.budget))
+    if heavy:
+        print('heavy modules imported at startup: %s' % ', '.join(sorted(heavy)))
+    return 1 if median>args.budget or heavy else 0
+
+if __name__=='__main__':
+    sys.exit(main())
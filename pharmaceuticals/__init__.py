@@ -0,0 +1,32 @@
+"""
+/***************************************************************************
+ pharmaceuticals
+
+ Importable core of the pharmaceuticals tool. The modules of this package
+ read the input csv file and simulate pharmaceuticals' concentration at the
+ outlet of a stream without any need of the Qt Dialog, so that they can be
+ used from scripts and services as well as from pharmaceuticals_v0.1.py.
+
+ Only the standard library and numpy are needed by the modules of this
+ package (heavy libraries like PyQt5 and matplotlib are imported only by the
+ modules that really need them).
+
+                              -------------------
+        begin                : 2018-06-25
+        version              : 0.1
+        copyright            : (C) 2018 by Giovanna De Filippis
+                               (Scuola Superiore Sant'Anna, Pisa, Italy)
+        email                : g.defilippis@santannapisa.it
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__version__='0.1'
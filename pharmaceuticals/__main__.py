@@ -0,0 +1,6 @@
+#Entry point of python -m pharmaceuticals (see pharmaceuticals.cli)
+import sys
+
+from pharmaceuticals.cli import main
+
+sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+/***************************************************************************
+ pharmaceuticals - batch
+
+ Batch processing of the csv files of many monitoring sites at once: all the
+ csv files of a folder (or matching glob patterns) are processed in parallel
+ by a pool of processes, one file per task, each with the distance, k and
+ fields of its own site. Each file gives its own output csv file and one line
+ of a summary table; a file which cannot be processed is reported in the
+ summary table and does not stop the others.
+
+ The sites are described by a csv file with one site per line:
+
+ Site;Distance (m);k (1/s);Concentration field;Sample ID field;Time field;Velocity field;Time format
+ Arno_*;1000;0.0001;Diclofenac (ng/l);;;;
+ Serchio;2500;0.0002;Diclofenac;ID;Time;Velocity;%d/%m/%Y %H:%M
+
+ where Site is the name of the input csv file without extension (or a pattern,
+ as in fnmatch, e.g. Arno_*); the first matching line is used. Empty values
+ (or missing columns) take the values given on the command line.
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import glob
+import os
+import time
+from collections import namedtuple
+from fnmatch import fnmatchcase
+
+import numpy
+
+from pharmaceuticals.pool import error_message, run_tasks
+from pharmaceuticals.reader import DELIMITER, read_columns
+from pharmaceuticals.streaming import CHUNK_SIZE, simulate_file
+
+#The Site tuple describes how to process the csv files of a site:
+#pattern        -> name of the input csv files of the site (without extension), or fnmatch pattern
+#distance       -> distance between the inlet and the outlet (m)
+#k              -> degradation rate coefficient (1/s)
+#conc_field     -> field of the concentration measured at the inlet
+#id_field       -> field of the sample ID
+#time_field     -> field of date and time of measurement
+#velocity_field -> field of the average velocity of the stream (m/s)
+#time_format    -> layout of date and time of measurement (as in datetime.strptime)
+Site=namedtuple('Site', ['pattern', 'distance', 'k', 'conc_field', 'id_field', 'time_field',
+                         'velocity_field', 'time_format'])
+
+#Headers of the fields of the csv file of the sites (in the order of Site)
+SITE_HEADERS=['Site', 'Distance (m)', 'k (1/s)', 'Concentration field', 'Sample ID field', 'Time field',
+              'Velocity field', 'Time format']
+
+#The FileSummary tuple holds the outcome of the processing of an input csv file:
+#site       -> pattern of the site the file belongs to (None if no site matches)
+#inputfile  -> path of the input csv file
+#outputfile -> path of the output csv file (None if the file failed)
+#samples    -> number of samples processed
+#mean, minimum, maximum -> statistics of the simulated concentrations at the outlet
+#seconds    -> time spent on the file (s)
+#error      -> error message (None if the file was processed)
+FileSummary=namedtuple('FileSummary', ['site', 'inputfile', 'outputfile', 'samples', 'mean', 'minimum',
+                                       'maximum', 'seconds', 'error'])
+
+#The read_sites function reads the sites from a csv file; empty values are None
+def read_sites(path, delimiter=DELIMITER):
+
+    table=read_columns(path, delimiter=delimiter)
+    size=len(table)
+    columns=[table.raw(header) if header in table else ['']*size for header in SITE_HEADERS]
+    sites=[]
+    for values in zip(*columns):
+        values=[value.strip() or None for value in values]
+        for i in (1, 2):
+            if values[i] is not None:
+                try:
+                    values[i]=float(values[i])
+                except ValueError:
+                    raise ValueError("Invalid %s '%s' for site '%s'" % (SITE_HEADERS[i], values[i], values[0])) from None
+        sites.append(Site(*values))
+    return sites
+
+#The find_inputs function returns the csv files given by a list of folders
+#(all the .csv files inside) and glob patterns, without repetitions
+def find_inputs(paths):
+
+    found=[]
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(sorted(glob.glob(os.path.join(path, '*.csv'))))
+        else:
+            found.extend(sorted(glob.glob(path)) or [path])
+    return list(dict.fromkeys(found))
+
+#The site_for function returns the site of an input csv file (the first site
+#whose pattern matches the name of the file), completed with the values of
+#defaults where the site has none
+def site_for(inputfile, sites, defaults):
+
+    name=os.path.splitext(os.path.basename(inputfile))[0]
+    for site in sites:
+        if site.pattern is not None and fnmatchcase(name, site.pattern):
+            return Site(*[default if value is None else value for value, default in zip(site, defaults)])
+    if sites:
+        raise ValueError("No site matches the file '%s'" % os.path.basename(inputfile))
+    return defaults._replace(pattern=None)
+
+#The process_file function runs the model on an input csv file of a site,
+#writes the results to the output folder and returns a FileSummary. Errors of
+#the file are reported in the summary instead of being raised
+def process_file(inputfile, site, outputdir, chunk_size=CHUNK_SIZE, delimiter=DELIMITER):
+
+    start=time.perf_counter()
+    outputfile=os.path.join(outputdir, os.path.splitext(os.path.basename(inputfile))[0]+'_outlet.csv')
+    #Running statistics of the concentrations at the outlet, chunk by chunk
+    stats={'sum': 0.0, 'minimum': numpy.inf, 'maximum': -numpy.inf}
+
+    def update(sample_id, date_time, inlet_conc, result):
+        if len(result.outlet_conc):
+            stats['sum']+=result.outlet_conc.sum()
+            stats['minimum']=min(stats['minimum'], result.outlet_conc.min())
+            stats['maximum']=max(stats['maximum'], result.outlet_conc.max())
+
+    try:
+        for name in ('distance', 'k', 'conc_field'):
+            if getattr(site, name) is None:
+                raise ValueError('No %s given for the site' % name.replace('_', ' '))
+        samples=simulate_file(inputfile, outputfile, site.id_field, site.time_field, site.velocity_field,
+                              site.conc_field, site.distance, site.k, chunk_size=chunk_size,
+                              time_format=site.time_format, delimiter=delimiter, update=update)
+        if not samples:
+            raise ValueError('No samples in the file')
+    except Exception as error:
+        #Whatever the error (e.g. a malformed line raising csv.Error), the other
+        #files go on; the results being written are discarded by simulate_file,
+        #leaving any former output file as it was
+        return FileSummary(site.pattern, inputfile, None, 0, None, None, None, time.perf_counter()-start,
+                           error_message(error))
+    return FileSummary(site.pattern, inputfile, outputfile, samples, float(stats['sum']/samples),
+                       float(stats['minimum']), float(stats['maximum']), time.perf_counter()-start, None)
+
+#The run_batch function processes the input csv files in parallel with a pool of
+#processes (one per CPU if processes is None), each with its own site, and
+#returns the FileSummary of each file (in the order of inputs). If given, done
+#is called with each FileSummary as soon as its file is done
+def run_batch(inputs, sites, defaults, outputdir, processes=None, chunk_size=CHUNK_SIZE,
+              delimiter=DELIMITER, done=None):
+
+    os.makedirs(outputdir, exist_ok=True)
+    summaries={}
+    tasks=[]
+    #Dictionary name of the file -> first input file with that name (the output
+    #files are named after the input files)
+    names={}
+    for inputfile in inputs:
+        name=os.path.basename(inputfile)
+        try:
+            if name in names:
+                raise ValueError("Same name as '%s'" % names[name])
+            names[name]=inputfile
+            tasks.append((inputfile, (site_for(inputfile, sites, defaults), outputdir, chunk_size, delimiter)))
+        except ValueError as error:
+            summaries[inputfile]=FileSummary(None, inputfile, None, 0, None, None, None, 0.0, str(error))
+            if done is not None:
+                done(summaries[inputfile])
+
+    def failed(inputfile, arguments, message):
+        return FileSummary(arguments[0].pattern, inputfile, None, 0, None, None, None, 0.0, message)
+
+    summaries.update(run_tasks(process_file, tasks, failed, processes, done))
+    return [summaries[inputfile] for inputfile in inputs if inputfile in summaries]
@@ -0,0 +1,287 @@
+"""
+/***************************************************************************
+ pharmaceuticals - cache
+
+ On-disk cache of the parsed input csv files, so that reopening the same file
+ needs no parsing at all. Each csv file gets an entry (a folder) holding its
+ headers and its fields as .npy files: raw values as their UTF-8 text, one
+ value after the other (so that an entry takes about as much room as the csv
+ file, whatever the length of the longest value), and typed arrays (numbers,
+ timestamps, strings) as soon as they are converted. On reload the typed
+ arrays are memory-mapped, so that only the parts really used are read from
+ the disk, and the raw values are read only for fields not converted yet.
+ Strings are saved only if their fixed-width array takes at most STRINGS_ROOM
+ times the room of their text (e.g. sample IDs, but not free notes of very
+ different lengths, which are made again from their text).
+
+ Entries are keyed on the path, size and modification time of the csv file
+ and on a hash of its content (sampled at fixed places of the file, so that
+ the key of a file of some GB is computed in milliseconds). The least recently
+ used entries are removed when the cache grows beyond its maximum size.
+
+ The folder of the cache is given by the PHARMACEUTICALS_CACHE_DIR environment
+ variable (default: ~/.cache/pharmaceuticals) and its maximum size in bytes by
+ PHARMACEUTICALS_CACHE_SIZE (default: 10 GB).
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy
+
+from pharmaceuticals.profiling import stage
+from pharmaceuticals.reader import DELIMITER, ColumnTable, read_columns
+
+#Version of the layout of the entries (changing it makes old entries unused)
+CACHE_VERSION=2
+
+#Default maximum size of the cache (bytes)
+CACHE_SIZE=10*2**30
+
+#Separator of the raw values in the text of a field
+SEPARATOR='\x00'
+
+#Strings of a field are saved (as a fixed-width array) only if they take at most
+#STRINGS_ROOM times the room of its text, e.g. the sample IDs but not free notes
+#of very different lengths
+STRINGS_ROOM=8
+
+#Number and size of the blocks of the csv file hashed to compute its key
+HASH_BLOCKS=16
+HASH_BLOCK_SIZE=65536
+
+#The cache_dir function returns the folder of the cache
+def cache_dir():
+
+    return os.environ.get('PHARMACEUTICALS_CACHE_DIR',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'pharmaceuticals'))
+
+#The cache_size function returns the maximum size of the cache (bytes)
+def cache_size():
+
+    return int(os.environ.get('PHARMACEUTICALS_CACHE_SIZE', CACHE_SIZE))
+
+#The cache_key function returns the key of the entry of a csv file, computed from
+#its path, size, modification time and the hash of HASH_BLOCKS blocks of its
+#content evenly spread from its beginning to its end
+def cache_key(path, delimiter=DELIMITER):
+
+    path=os.path.abspath(path)
+    status=os.stat(path)
+    digest=hashlib.blake2b(digest_size=20)
+    digest.update(json.dumps([CACHE_VERSION, path, status.st_size, status.st_mtime_ns, delimiter]).encode())
+    with open(path, 'rb') as inputfile:
+        last=max(0, status.st_size-HASH_BLOCK_SIZE)
+        for offset in sorted(set(numpy.linspace(0, last, HASH_BLOCKS).astype(numpy.int64).tolist())):
+            inputfile.seek(offset)
+            digest.update(inputfile.read(HASH_BLOCK_SIZE))
+    return digest.hexdigest()
+
+#The CachedColumnTable class is a ColumnTable whose fields are memory-mapped
+#from the .npy files of an entry of the cache. Typed arrays converted for the
+#first time (strings only if not much larger than their text) are saved to the
+#entry, so that they are memory-mapped next time
+class CachedColumnTable(ColumnTable):
+
+    def __init__(self, directory, headers, rows):
+
+        super(CachedColumnTable, self).__init__(headers, [])
+        self.directory=directory
+        self.rows=rows
+
+    def __len__(self):
+
+        return self.rows
+
+    def __contains__(self, name):
+
+        return name in self.headers
+
+    def raw(self, name):
+
+        if name not in self._raw:
+            path=self._path(name, 'text')
+            if os.path.exists(path):
+                self._raw[name]=split_text(numpy.load(path), self.rows)
+            else:
+                self._raw[name]=numpy.load(self._path(name, 'raw'), mmap_mode='r')
+        return self._raw[name]
+
+    def _convert(self, name, kind, function):
+
+        key=(name, kind)
+        if key not in self._typed:
+            label='convert:%s' % (kind if isinstance(kind, str) else kind[0])
+            if isinstance(kind, tuple):
+                #Timestamps are saved for each layout of date and time
+                kind='%s-%s' % (kind[0], hashlib.blake2b(kind[1].encode(), digest_size=4).hexdigest())
+            path=self._path(name, kind)
+            if os.path.exists(path):
+                self._typed[key]=numpy.load(path, mmap_mode='r')
+            else:
+                with stage(label, self.rows):
+                    self._typed[key]=function(self.raw(name))
+                #Strings are saved only if their fixed-width array is not much
+                #larger than their text (they are made again from the text otherwise)
+                if kind!='strings' or self._typed[key].nbytes<=STRINGS_ROOM*self._text_size(name):
+                    save_array(path, self._typed[key])
+        return self._typed[key]
+
+    #The _text_size method returns the size (bytes) of the raw values of a field
+    #saved in the entry
+    def _text_size(self, name):
+
+        for kind in ('text', 'raw'):
+            if os.path.exists(self._path(name, kind)):
+                return os.path.getsize(self._path(name, kind))
+        return 0
+
+    #The _path method returns the path of the .npy file of a field
+    def _path(self, name, kind):
+
+        if name not in self.headers:
+            raise KeyError("No field '%s' in the csv file" % name)
+        return os.path.join(self.directory, '%d.%s.npy' % (self.headers.index(name), kind))
+
+#The save_array function saves an array to a .npy file (through a temporary
+#file, so that no other process ever sees a file half written)
+def save_array(path, values):
+
+    descriptor, temporary=tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as outputfile:
+            numpy.save(outputfile, values)
+        os.replace(temporary, path)
+    except OSError:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+#The join_text function returns the raw values of a field as the bytes (uint8
+#array) of their UTF-8 text joined by SEPARATOR, or None if some value holds
+#SEPARATOR itself
+def join_text(values):
+
+    text=SEPARATOR.join(values)
+    if text.count(SEPARATOR)!=max(len(values)-1, 0):
+        return None
+    return numpy.frombuffer(text.encode('utf-8'), dtype=numpy.uint8)
+
+#The split_text function returns the rows raw values of a field from the bytes
+#written by join_text
+def split_text(data, rows):
+
+    if not rows:
+        return []
+    return data.tobytes().decode('utf-8').split(SEPARATOR)
+
+#The raw_array function converts the raw values of a field into an array of
+#fixed-width bytes (or of strings, if some values are not ASCII), for the
+#fields which cannot be joined by join_text
+def raw_array(values):
+
+    try:
+        return numpy.array(values, dtype='S')
+    except UnicodeEncodeError:
+        return numpy.array(values, dtype=str)
+
+#The write_entry function writes the entry of a ColumnTable into the folder directory
+def write_entry(directory, table):
+
+    temporary=tempfile.mkdtemp(dir=os.path.dirname(directory), suffix='.tmp')
+    try:
+        for index, name in enumerate(table.headers):
+            values=table.raw(name)
+            text=join_text(values)
+            if text is not None:
+                numpy.save(os.path.join(temporary, '%d.text.npy' % index), text)
+            else:
+                numpy.save(os.path.join(temporary, '%d.raw.npy' % index), raw_array(values))
+        with open(os.path.join(temporary, 'meta.json'), 'w') as metafile:
+            json.dump({'headers': table.headers, 'rows': len(table)}, metafile)
+        os.rename(temporary, directory)
+    except OSError:
+        #Another process may have written the same entry meanwhile
+        shutil.rmtree(temporary, ignore_errors=True)
+
+#The read_entry function returns the CachedColumnTable of the entry in the folder
+#directory, or None if there is no such entry
+def read_entry(directory):
+
+    try:
+        with open(os.path.join(directory, 'meta.json')) as metafile:
+            meta=json.load(metafile)
+    except (OSError, ValueError):
+        return None
+    return CachedColumnTable(directory, meta['headers'], meta['rows'])
+
+#The entry_size function returns the size (bytes) of an entry of the cache
+def entry_size(directory):
+
+    size=0
+    for name in os.listdir(directory):
+        size+=os.path.getsize(os.path.join(directory, name))
+    return size
+
+#The evict function removes the least recently used entries of the cache (except
+#the entry keep, just used) until the cache is not larger than max_size bytes
+def evict(root, max_size, keep=None):
+
+    entries=[]
+    for name in os.listdir(root):
+        directory=os.path.join(root, name)
+        if os.path.isdir(directory) and not name.endswith('.tmp'):
+            try:
+                entries.append((os.path.getmtime(directory), entry_size(directory), directory))
+            except OSError:
+                pass
+    total=sum(size for _, size, _ in entries)
+    for _, size, directory in sorted(entries):
+        if total<=max_size:
+            break
+        if directory!=keep:
+            shutil.rmtree(directory, ignore_errors=True)
+            total-=size
+
+#The read_columns_cached function returns the fields of a csv file as read_columns
+#does, taking them from the cache if the same file has been read before and
+#storing them in the cache otherwise
+def read_columns_cached(path, delimiter=DELIMITER, progress=None, root=None, max_size=None):
+
+    root=cache_dir() if root is None else root
+    max_size=cache_size() if max_size is None else max_size
+    try:
+        os.makedirs(root, exist_ok=True)
+    except OSError:
+        #No cache at all if its folder cannot be created
+        return read_columns(path, delimiter=delimiter, progress=progress)
+    directory=os.path.join(root, cache_key(path, delimiter))
+
+    with stage('cache_read'):
+        table=read_entry(directory)
+    if table is None:
+        parsed=read_columns(path, delimiter=delimiter, progress=progress)
+        with stage('cache_write', len(parsed)):
+            write_entry(directory, parsed)
+        table=read_entry(directory)
+        if table is None:
+            #The entry could not be written (e.g. the disk is full)
+            return parsed
+    else:
+        #The modification time of an entry tells when it was last used
+        os.utime(directory)
+    evict(root, max_size, keep=directory)
+    return table
@@ -0,0 +1,181 @@
+"""
+/***************************************************************************
+ pharmaceuticals - calibration
+
+ Estimation of the degradation rate coefficient k (1/s) from concentrations
+ measured both at the inlet and at the outlet. Each sample measured at the
+ outlet is matched to the sample of the inlet whose simulated arrival time is
+ the closest; for the matched pairs the model C_outlet = C_inlet * exp(-k*t)
+ gives ln(C_inlet/C_outlet) = k*t, so that k is estimated by:
+
+ loglinear -> least squares of the log-linear model (closed form)
+ huber     -> robust fit of the log-linear model (iteratively reweighted least
+              squares with Huber weights), for data with outliers
+ nonlinear -> least squares of the concentrations themselves (Gauss-Newton,
+              starting from the log-linear estimate)
+
+ All the series (e.g. every compound of every site) are fitted at once: the
+ pairs of each series are a row of series x pairs arrays (padded and masked),
+ and every step of the fits is a vectorized operation over all the rows.
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from collections import namedtuple
+
+import numpy
+
+from pharmaceuticals.engine import arrival_times, as_timestamps, travel_times
+from pharmaceuticals.profiling import stage
+
+#Methods of estimation of k
+METHODS=['loglinear', 'huber', 'nonlinear']
+
+#Default number of iterations of the huber and nonlinear methods
+ITERATIONS=20
+
+#Tuning constant of the Huber weights (95% efficiency for normal residuals)
+HUBER=1.345
+
+#The CalibrationResult tuple holds the estimates of k of many series:
+#k      -> estimated degradation rate coefficient (1/s) of each series
+#stderr -> standard error of each k (from the residuals of the log-linear model)
+#pairs  -> number of pairs of inlet and outlet samples used for each series
+#rmse   -> root mean square error of the simulated concentrations at the outlet
+CalibrationResult=namedtuple('CalibrationResult', ['k', 'stderr', 'pairs', 'rmse'])
+
+#The match_samples function matches each sample measured at the outlet to the
+#sample of the inlet arriving at the outlet closest in time. It returns the
+#indices of the matched inlet and outlet samples; outlet samples with no
+#arrival within tolerance seconds are left out (by default, the tolerance is
+#half the median interval between two arrivals)
+def match_samples(arrival_time, outlet_time, tolerance=None):
+
+    arrival=as_timestamps(arrival_time).astype('datetime64[us]').astype(numpy.int64)/1e6
+    outlet=as_timestamps(outlet_time).astype('datetime64[us]').astype(numpy.int64)/1e6
+    if not len(arrival) or not len(outlet):
+        return numpy.zeros(0, dtype=numpy.intp), numpy.zeros(0, dtype=numpy.intp)
+    order=numpy.argsort(arrival, kind='stable')
+    arrival=arrival[order]
+    if tolerance is None:
+        tolerance=numpy.median(numpy.diff(arrival))/2 if len(arrival)>1 else numpy.inf
+
+    #Nearest arrival before or after each outlet sample
+    if len(arrival)>1:
+        after=numpy.clip(numpy.searchsorted(arrival, outlet), 1, len(arrival)-1)
+        before=after-1
+        nearest=numpy.where(numpy.abs(arrival[before]-outlet)<=numpy.abs(arrival[after]-outlet), before, after)
+    else:
+        nearest=numpy.zeros(len(outlet), dtype=numpy.intp)
+    matched=numpy.flatnonzero(numpy.abs(arrival[nearest]-outlet)<=tolerance)
+    return order[nearest[matched]], matched
+
+#The pair_series function returns the series x pairs arrays of concentrations
+#at the inlet and at the outlet and travel times for a list of series, each given
+#as (inlet_conc, outlet_conc, travel_time) of its matched pairs; shorter series
+#are padded and the returned mask tells the pairs which can be used
+def pair_series(series):
+
+    length=max([len(inlet_conc) for inlet_conc, outlet_conc, travel_time in series]+[0])
+    shape=(len(series), length)
+    inlet=numpy.ones(shape)
+    outlet=numpy.ones(shape)
+    time=numpy.zeros(shape)
+    mask=numpy.zeros(shape, dtype=bool)
+    for i, (inlet_conc, outlet_conc, travel_time) in enumerate(series):
+        size=len(inlet_conc)
+        inlet[i, :size]=inlet_conc
+        outlet[i, :size]=outlet_conc
+        time[i, :size]=travel_time
+        mask[i, :size]=True
+    return inlet, outlet, time, mask
+
+#The fit_k function estimates k for many series at once. inlet_conc, outlet_conc
+#and travel_time are series x pairs arrays (travel_time may be broadcast) and
+#mask tells the pairs to use; pairs with concentrations not greater than zero
+#or not finite are always left out
+def fit_k(inlet_conc, outlet_conc, travel_time, mask=None, method='loglinear', iterations=ITERATIONS):
+
+    if method not in METHODS:
+        raise ValueError("Unknown method '%s' (choose from %s)" % (method, ', '.join(METHODS)))
+    inlet_conc=numpy.atleast_2d(numpy.asarray(inlet_conc, dtype=numpy.float64))
+    outlet_conc=numpy.atleast_2d(numpy.asarray(outlet_conc, dtype=numpy.float64))
+    time=numpy.broadcast_to(numpy.asarray(travel_time, dtype=numpy.float64), inlet_conc.shape)
+    valid=(inlet_conc>0)&(outlet_conc>0)&numpy.isfinite(inlet_conc)&numpy.isfinite(outlet_conc)&numpy.isfinite(time)
+    if mask is not None:
+        valid&=numpy.broadcast_to(mask, valid.shape)
+
+    with stage('calibrate', inlet_conc.size):
+        #y=ln(C_inlet/C_outlet)=k*t, with the unused pairs set to zero
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            y=numpy.where(valid, numpy.log(numpy.where(valid, inlet_conc/outlet_conc, 1.0)), 0.0)
+        t=numpy.where(valid, time, 0.0)
+        k=weighted_slope(t, y, valid.astype(numpy.float64))
+
+        if method=='huber':
+            for _ in range(iterations):
+                residual=numpy.where(valid, y-k[:, numpy.newaxis]*t, numpy.nan)
+                #Robust scale of the residuals of each series (median absolute deviation)
+                with numpy.errstate(all='ignore'):
+                    scale=1.4826*numpy.nanmedian(numpy.abs(residual), axis=1)[:, numpy.newaxis]
+                    weights=numpy.where(valid, numpy.minimum(1.0, HUBER*scale/numpy.abs(residual)), 0.0)
+                weights=numpy.where(numpy.isnan(weights), 1.0*valid, weights)
+                k=weighted_slope(t, y, weights)
+        elif method=='nonlinear':
+            c_in=numpy.where(valid, inlet_conc, 0.0)
+            c_out=numpy.where(valid, outlet_conc, 0.0)
+            for _ in range(iterations):
+                model=c_in*numpy.exp(-k[:, numpy.newaxis]*t)
+                #Derivative of the model with respect to k
+                slope=-t*model
+                with numpy.errstate(divide='ignore', invalid='ignore'):
+                    step=(slope*(c_out-model)).sum(axis=1)/(slope*slope).sum(axis=1)
+                k=k+numpy.where(numpy.isfinite(step), step, 0.0)
+
+        pairs=valid.sum(axis=1)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            residual=numpy.where(valid, y-k[:, numpy.newaxis]*t, 0.0)
+            stderr=numpy.sqrt((residual**2).sum(axis=1)/(pairs-1)/(t*t).sum(axis=1))
+            error=numpy.where(valid, outlet_conc-inlet_conc*numpy.exp(-k[:, numpy.newaxis]*t), 0.0)
+            rmse=numpy.sqrt((error**2).sum(axis=1)/pairs)
+    return CalibrationResult(k, numpy.where(pairs>1, stderr, numpy.nan), pairs, numpy.where(pairs>0, rmse, numpy.nan))
+
+#The weighted_slope function returns the weighted least squares slope through
+#the origin of each row of y vs t (NaN for rows with no weight)
+def weighted_slope(t, y, weights):
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return (weights*t*y).sum(axis=1)/(weights*t*t).sum(axis=1)
+
+#The calibrate function estimates k of many compounds of a site. inlet_concs and
+#outlet_concs are dictionaries compound -> concentrations measured at the inlet
+#and at the outlet, velocity and date_time belong to the samples of the inlet,
+#outlet_time to the samples of the outlet, distance is the distance (m) between
+#the inlet and the outlet. It returns the list of compounds and the
+#CalibrationResult (one series per compound)
+def calibrate(inlet_concs, outlet_concs, velocity, date_time, outlet_time, distance,
+              method='loglinear', tolerance=None, iterations=ITERATIONS):
+
+    series=match_site(inlet_concs, outlet_concs, velocity, date_time, outlet_time, distance, tolerance)
+    compounds=list(inlet_concs)
+    return compounds, fit_k(*pair_series(series), method=method, iterations=iterations)
+
+#The match_site function returns the matched pairs (inlet_conc, outlet_conc,
+#travel_time) of each compound of a site, as used by pair_series; samples are
+#matched once and shared by all the compounds
+def match_site(inlet_concs, outlet_concs, velocity, date_time, outlet_time, distance, tolerance=None):
+
+    travel_time=travel_times(velocity, distance)
+    inlet_index, outlet_index=match_samples(arrival_times(date_time, travel_time), outlet_time, tolerance)
+    return [(numpy.asarray(inlet_concs[compound], dtype=numpy.float64)[inlet_index],
+             numpy.asarray(outlet_concs[compound], dtype=numpy.float64)[outlet_index],
+             travel_time[inlet_index]) for compound in inlet_concs]
@@ -0,0 +1,518 @@
+"""
+/***************************************************************************
+ pharmaceuticals - cli
+
+ Command-line interface of the pharmaceuticals tool, to run the model
+ without the Dialog (e.g. in nightly jobs on headless machines):
+
+ python -m pharmaceuticals run input.csv --conc-field "Diclofenac (ng/l)"
+                               --distance 1000 --k 0.0001 --output out.csv
+
+ or, for many compounds at once (each with its own k):
+
+ python -m pharmaceuticals compounds input.csv --k-file k_values.csv
+                                     --distance 1000 --output out.csv
+
+ Only the standard library and numpy are imported (no PyQt5, pandas or
+ matplotlib), so that the command starts in a few milliseconds.
+
+ With --profile (before the command) the time, rows and memory of each stage
+ are reported as JSON (see pharmaceuticals.profiling):
+
+ python -m pharmaceuticals --profile profile.json run input.csv ...
+
+ (--profile - writes one JSON line per stage to stderr instead)
+
+ With run --format npy the results are written to a folder with one .npy
+ file per column instead of a csv file (see pharmaceuticals.export)
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+#Importing the argparse module to read the command-line arguments
+import argparse
+import csv
+import os
+import sys
+import time
+
+import numpy
+
+from pharmaceuticals import profiling
+from pharmaceuticals.batch import Site, find_inputs, read_sites, run_batch
+from pharmaceuticals.cache import read_columns_cached
+from pharmaceuticals.calibration import ITERATIONS, METHODS, fit_k, match_site, pair_series
+from pharmaceuticals.engine import simulate_compounds
+from pharmaceuticals.export import (FORMATS, write_calibration_csv, write_compounds_csv, write_network_csv,
+                                    write_percentiles_csv, write_summary_csv, write_sweep_csv)
+from pharmaceuticals.network import read_network, route_network
+from pharmaceuticals.reader import DELIMITER, TIME_FORMAT, read_columns
+from pharmaceuticals.streaming import CHUNK_SIZE, simulate_file
+from pharmaceuticals.sweep import parse_grid, sweep
+from pharmaceuticals.uncertainty import Distribution, simulate_uncertainty
+from pharmaceuticals.watch import INTERVAL, watch_file
+
+#The add_field_arguments function adds to a parser the arguments for the names
+#of the fields of the input csv file (defaults are the headers of the example
+#file in documentation/example_application)
+def add_field_arguments(parser):
+
+    parser.add_argument('--id-field', default='Sample ID',
+                        help="field of the sample ID (default: '%(default)s')")
+    parser.add_argument('--time-field', default='Date and Time',
+                        help="field of date and time of measurement (default: '%(default)s')")
+    parser.add_argument('--time-format', default=TIME_FORMAT,
+                        help="layout of date and time of measurement, as in datetime.strptime (default: '%(default)s')")
+    parser.add_argument('--velocity-field', default='Avg velocity (m/s)',
+                        help="field of the average velocity of the stream, m/s (default: '%(default)s')")
+    parser.add_argument('--delimiter', default=DELIMITER,
+                        help="delimiter of the fields of the csv files (default: '%(default)s')")
+
+#The add_integrate_argument function adds to a parser the --integrate-velocity argument
+def add_integrate_argument(parser):
+
+    parser.add_argument('--integrate-velocity', action='store_true',
+                        help='compute travel times following the velocities measured during the transit '
+                             '(integrated over time) instead of the velocity measured with each sample')
+
+#The load_table function reads the whole input csv file (through the on-disk
+#cache of parsed csv files, if --cache is given)
+def load_table(args):
+
+    if args.cache:
+        return read_columns_cached(args.input, delimiter=args.delimiter)
+    return read_columns(args.input, delimiter=args.delimiter)
+
+#The add_cache_argument function adds to a parser the --cache argument
+def add_cache_argument(parser):
+
+    parser.add_argument('--cache', action='store_true',
+                        help='keep the parsed input csv file in the on-disk cache (PHARMACEUTICALS_CACHE_DIR), '
+                             'so that reading it again needs no parsing')
+
+#The run_command function runs the model on a whole input csv file and writes
+#the simulated series at the outlet to the output csv file (or folder of .npy
+#files). The input file is processed in chunks of --chunk-size lines, so that
+#files of any size can be used
+def run_command(args):
+
+    samples=simulate_file(args.input, args.output, args.id_field, args.time_field,
+                          args.velocity_field, args.conc_field, args.distance, args.k,
+                          chunk_size=args.chunk_size, time_format=args.time_format,
+                          delimiter=args.delimiter, output_format=args.format,
+                          integrate=args.integrate_velocity)
+    print('%d samples written to %s' % (samples, args.output))
+
+#The watch_command function follows an input csv file as it grows (e.g. fed by
+#an autosampler) and appends the results of the new lines to the output csv file
+#(and, with --plot, to a plot updated live) until interrupted with Ctrl+C
+def watch_command(args):
+
+    update=None
+    sleep=time.sleep
+
+    #Lines with invalid values are reported and skipped, so that the watch goes on
+    def skipped(row, message):
+        print("Skipped line '%s': %s" % (args.delimiter.join(row), message), file=sys.stderr, flush=True)
+
+    if args.plot:
+        update, sleep=live_plot(args.conc_field)
+    try:
+        samples=watch_file(args.input, args.output, args.id_field, args.time_field, args.velocity_field,
+                           args.conc_field, args.distance, args.k, interval=args.interval,
+                           updates=args.updates, update=update, sleep=sleep,
+                           time_format=args.time_format, delimiter=args.delimiter, skipped=skipped)
+    except KeyboardInterrupt:
+        return
+    print('%d new samples appended to %s' % (samples, args.output))
+
+#The live_plot function opens a plot of measured and simulated concentrations
+#and returns the functions adding the new samples to it and waiting between
+#two updates (matplotlib is imported only here)
+def live_plot(conc_field):
+
+    from matplotlib import pyplot
+    from pharmaceuticals.plotting import ResponsiveSeries
+
+    pyplot.ion()
+    axes=pyplot.figure().add_subplot(1, 1, 1)
+    empty=numpy.array([], dtype='datetime64[s]')
+    inlet=ResponsiveSeries(axes, empty, [], label='Measured at the inlet')
+    outlet=ResponsiveSeries(axes, empty, [], label='Simulated at the outlet')
+    axes.set_title(conc_field)
+    axes.set_xlabel('Time')
+    axes.legend(loc='upper left')
+
+    def update(sample_id, date_time, inlet_conc, result):
+        inlet.extend(date_time, inlet_conc)
+        outlet.extend(result.arrival_time, result.outlet_conc)
+        axes.figure.canvas.draw_idle()
+
+    return update, pyplot.pause
+
+#The batch_command function processes the csv files of many sites in parallel,
+#writing an output csv file per input file and the summary table of the batch
+def batch_command(args):
+
+    inputs=find_inputs(args.inputs)
+    if not inputs:
+        raise ValueError('No input csv file found')
+    sites=read_sites(args.sites, delimiter=args.delimiter) if args.sites else []
+    defaults=Site('*', args.distance, args.k, args.conc_field, args.id_field, args.time_field,
+                  args.velocity_field, args.time_format)
+
+    def done(summary):
+        print('%s: %s' % (summary.inputfile, summary.error or '%d samples' % summary.samples), flush=True)
+
+    summaries=run_batch(inputs, sites, defaults, args.output_dir, processes=args.processes,
+                        chunk_size=args.chunk_size, delimiter=args.delimiter, done=done)
+    summaryfile=os.path.join(args.output_dir, 'summary.csv')
+    write_summary_csv(summaryfile, summaries, delimiter=args.delimiter)
+    failed=sum(1 for summary in summaries if summary.error is not None)
+    print('%d files processed, %d failed; summary written to %s' % (len(summaries)-failed, failed, summaryfile))
+
+#The figures_command function renders the figures of many result files (csv
+#files, or folders of .npy files written by run --format npy) to image files in
+#parallel, with no display (matplotlib is imported only by this command)
+def figures_command(args):
+
+    from pharmaceuticals.figures import render_figures
+
+    inputs=[]
+    for path in args.inputs:
+        #Folders of .npy files are result files themselves
+        if os.path.isfile(os.path.join(path, 'outlet_conc.npy')):
+            inputs.append(path)
+        else:
+            inputs.extend(find_inputs([path]))
+    if not inputs:
+        raise ValueError('No result file found')
+
+    def done(summary):
+        print('%s: %s' % (summary.inputfile, summary.error or '%d figures' % len(summary.outputfiles)), flush=True)
+
+    summaries=render_figures(inputs, args.output_dir, args.format, processes=args.processes,
+                             size=(args.width, args.height), dpi=args.dpi, delimiter=args.delimiter, done=done)
+    failed=sum(1 for summary in summaries if summary.error is not None)
+    print('%d figures written to %s, %d files failed' % (sum(len(summary.outputfiles) for summary in summaries),
+                                                         args.output_dir, failed))
+
+#The read_k_values function returns the dictionary compound -> k given by the
+#--compound arguments (FIELD=K) and by the lines of the --k-file csv file (FIELD;K)
+def read_k_values(args):
+
+    k_values={}
+    if args.k_file:
+        with open(args.k_file, newline='') as kfile:
+            for row in csv.reader(kfile, delimiter=args.delimiter):
+                if row:
+                    k_values[row[0]]=parse_k(row[0], row[1] if len(row)>1 else '')
+    for item in args.compound:
+        compound, _, k=item.rpartition('=')
+        k_values[compound]=parse_k(compound, k)
+    if not k_values:
+        raise ValueError('No compound given: use --compound FIELD=K or --k-file')
+    return k_values
+
+#The parse_k function converts the degradation rate coefficient of a compound into a number
+def parse_k(compound, k):
+
+    try:
+        return float(k)
+    except ValueError:
+        raise ValueError("Invalid degradation rate coefficient '%s' for '%s'" % (k, compound)) from None
+
+#The parse_distance function converts the distance between the inlet and the
+#outlet of a site into a number
+def parse_distance(site, distance):
+
+    try:
+        return float(distance)
+    except ValueError:
+        raise ValueError("Invalid distance '%s' for site '%s'" % (distance, site)) from None
+
+#The compounds_command function runs the model for many compounds of a whole
+#input csv file and writes the simulated series at the outlet to the output csv file
+def compounds_command(args):
+
+    k_values=read_k_values(args)
+    table=load_table(args)
+    date_time=table.timestamps(args.time_field, args.time_format)
+    inlet_concs=dict((compound, table.numbers(compound)) for compound in k_values)
+    result=simulate_compounds(inlet_concs, table.numbers(args.velocity_field), date_time,
+                              args.distance, k_values, integrate=args.integrate_velocity)
+    write_compounds_csv(args.output, table.strings(args.id_field), date_time, result,
+                        delimiter=args.delimiter)
+    print('%d samples of %d compounds written to %s' % (len(date_time), len(k_values), args.output))
+
+#The read_sources function returns the dictionary source node -> concentrations
+#given by the --source arguments (NODE=FIELD for a field of the input csv file,
+#or NODE=VALUE for a constant concentration)
+def read_sources(args, table):
+
+    sources={}
+    for item in args.source:
+        node, _, field=item.rpartition('=')
+        if field in table:
+            sources[node]=table.numbers(field)
+        else:
+            try:
+                sources[node]=float(field)
+            except ValueError:
+                raise ValueError("No field '%s' in the csv file for the source node '%s'" % (field, node)) from None
+    return sources
+
+#The network_command function routes the samples of a whole input csv file
+#through a network of reaches and writes arrival times and concentrations at
+#the nodes to the output csv file
+def network_command(args):
+
+    reaches=read_network(args.network, delimiter=args.delimiter)
+    table=load_table(args)
+    date_time=table.timestamps(args.time_field, args.time_format)
+    keep=set(args.nodes.split(',')) if args.nodes else None
+    result=route_network(reaches, read_sources(args, table), table.numbers(args.velocity_field),
+                         date_time, keep=keep)
+    write_network_csv(args.output, table.strings(args.id_field), date_time, result, delimiter=args.delimiter)
+    print('%d samples at %d nodes written to %s' % (len(date_time), len(result.nodes), args.output))
+
+#The calibrate_command function estimates k of each compound of each site from
+#the concentrations measured at the inlet and at the outlet; all the compounds of
+#all the sites are fitted at once
+def calibrate_command(args):
+
+    if not args.compound:
+        raise ValueError('No compound given: use --compound FIELD or --compound INLET_FIELD=OUTLET_FIELD')
+    fields=[item.partition('=')[::2] for item in args.compound]
+    fields=[(inlet, outlet or inlet) for inlet, outlet in fields]
+    outlet_time_field=args.outlet_time_field or args.time_field
+
+    sites=[]
+    compounds=[]
+    series=[]
+    for inputfile, outletfile, distance in args.site:
+        inlet=read_columns(inputfile, delimiter=args.delimiter)
+        outlet=read_columns(outletfile, delimiter=args.delimiter)
+        series+=match_site(dict((field, inlet.numbers(field)) for field, _ in fields),
+                           dict((field, outlet.numbers(outlet_field)) for field, outlet_field in fields),
+                           inlet.numbers(args.velocity_field), inlet.timestamps(args.time_field, args.time_format),
+                           outlet.timestamps(outlet_time_field, args.time_format),
+                           parse_distance(inputfile, distance), args.tolerance)
+        sites+=[inputfile]*len(fields)
+        compounds+=[field for field, _ in fields]
+
+    result=fit_k(*pair_series(series), method=args.method, iterations=args.iterations)
+    for site, compound, k, stderr, pairs in zip(sites, compounds, result.k, result.stderr, result.pairs):
+        print('%s, %s: k=%g 1/s (standard error %g, %d pairs)' % (site, compound, k, stderr, pairs))
+    if args.output:
+        write_calibration_csv(args.output, sites, compounds, result, delimiter=args.delimiter)
+
+#The sweep_command function runs the model for every pair of a grid of k values
+#and distances and writes the summary statistics of each scenario (and, if
+#requested, the whole cube of concentrations at the outlet as a .npy file)
+def sweep_command(args):
+
+    table=load_table(args)
+    result=sweep(table.numbers(args.conc_field), table.numbers(args.velocity_field),
+                 parse_grid(args.k), parse_grid(args.distance), processes=args.processes,
+                 cube=args.cube is not None)
+    write_sweep_csv(args.output, result, delimiter=args.delimiter)
+    if args.cube:
+        numpy.save(args.cube, result.outlet_conc)
+    print('%d scenarios of %d samples written to %s' % (result.mean.size, len(table), args.output))
+
+#The uncertainty_command function runs a Monte Carlo simulation with uncertain
+#k, distance and velocities and writes the percentiles of the concentrations at
+#the outlet of each sample
+def uncertainty_command(args):
+
+    table=load_table(args)
+    percentiles=[float(percentile) for percentile in args.percentiles.split(',')]
+    result=simulate_uncertainty(table.numbers(args.conc_field), table.numbers(args.velocity_field),
+                                Distribution.parse(args.k), Distribution.parse(args.distance),
+                                Distribution.parse(args.velocity_factor), draws=args.draws,
+                                percentiles=percentiles, seed=args.seed)
+    write_percentiles_csv(args.output, table.strings(args.id_field),
+                          table.timestamps(args.time_field, args.time_format), result,
+                          delimiter=args.delimiter)
+    print('%d samples written to %s' % (len(table), args.output))
+
+#The build_parser function returns the parser of the command-line arguments
+def build_parser():
+
+    parser=argparse.ArgumentParser(prog='python -m pharmaceuticals',
+                                   description="Simulate pharmaceuticals' concentration at the outlet of a stream.")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="report time, rows and memory of each stage as a JSON report written to FILE "
+                             "('-' for one JSON line per stage on stderr)")
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='also trace the memory allocated by each stage (slower)')
+    commands=parser.add_subparsers(dest='command', metavar='command')
+    commands.required=True
+
+    run=commands.add_parser('run', help='simulate the concentration at the outlet for a whole csv file')
+    run.add_argument('input', help='input csv file')
+    add_field_arguments(run)
+    run.add_argument('--conc-field', required=True,
+                     help='field of the concentration measured at the inlet')
+    run.add_argument('--distance', type=float, required=True, help='distance covered, m')
+    run.add_argument('--k', type=float, required=True, help='degradation rate coefficient, 1/s')
+    run.add_argument('--output', required=True, help='output csv file (output folder with --format npy)')
+    run.add_argument('--format', choices=FORMATS, default='csv',
+                     help='format of the output: a csv file, or a folder with one .npy file per column '
+                          '(default: %(default)s)')
+    run.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                     help='number of lines of the input csv file processed at a time (default: %(default)s)')
+    add_integrate_argument(run)
+    run.set_defaults(function=run_command)
+
+    compounds=commands.add_parser('compounds', help='simulate the concentration at the outlet of many compounds at once')
+    compounds.add_argument('input', help='input csv file')
+    add_field_arguments(compounds)
+    add_cache_argument(compounds)
+    compounds.add_argument('--compound', action='append', default=[], metavar='FIELD=K',
+                           help='field of a compound and its degradation rate coefficient, 1/s (repeatable)')
+    compounds.add_argument('--k-file',
+                           help='csv file with one compound per line: field and degradation rate coefficient, 1/s')
+    compounds.add_argument('--distance', type=float, required=True, help='distance covered, m')
+    compounds.add_argument('--output', required=True, help='output csv file')
+    add_integrate_argument(compounds)
+    compounds.set_defaults(function=compounds_command)
+
+    batch=commands.add_parser('batch', help='process the csv files of many sites in parallel')
+    batch.add_argument('inputs', nargs='+', metavar='input', help='folder of input csv files, or glob pattern')
+    add_field_arguments(batch)
+    batch.add_argument('--sites', help='csv file of the distance, k and fields of each site (see pharmaceuticals/batch.py)')
+    batch.add_argument('--conc-field', help='field of the concentration measured at the inlet (for sites with none)')
+    batch.add_argument('--distance', type=float, help='distance covered, m (for sites with none)')
+    batch.add_argument('--k', type=float, help='degradation rate coefficient, 1/s (for sites with none)')
+    batch.add_argument('--output-dir', required=True, help='folder of the output csv files and of summary.csv')
+    batch.add_argument('--processes', type=int, help='number of worker processes (default: one per CPU)')
+    batch.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                       help='number of lines of each input csv file processed at a time (default: %(default)s)')
+    batch.set_defaults(function=batch_command)
+
+    figures=commands.add_parser('figures', help='render the figures of many result files to image files, with no display')
+    figures.add_argument('inputs', nargs='+', metavar='input',
+                         help='result csv file (of run, compounds, batch or watch), folder of result csv files, '
+                              'glob pattern or folder of .npy files (of run --format npy)')
+    figures.add_argument('--output-dir', required=True, help='folder of the image files')
+    figures.add_argument('--format', choices=['png', 'svg', 'pdf'], default='png',
+                         help='format of the image files (default: %(default)s)')
+    figures.add_argument('--width', type=float, default=10.0, help='width of the figures, inches (default: %(default)s)')
+    figures.add_argument('--height', type=float, default=6.0, help='height of the figures, inches (default: %(default)s)')
+    figures.add_argument('--dpi', type=int, default=100, help='resolution of the figures, dots per inch (default: %(default)s)')
+    figures.add_argument('--processes', type=int, help='number of worker processes (default: one per CPU)')
+    figures.add_argument('--delimiter', default=DELIMITER,
+                         help="delimiter of the fields of the csv files (default: '%(default)s')")
+    figures.set_defaults(function=figures_command)
+
+    watch=commands.add_parser('watch', help='follow an input csv file as it grows and simulate only the new lines')
+    watch.add_argument('input', help='input csv file')
+    add_field_arguments(watch)
+    watch.add_argument('--conc-field', required=True,
+                       help='field of the concentration measured at the inlet')
+    watch.add_argument('--distance', type=float, required=True, help='distance covered, m')
+    watch.add_argument('--k', type=float, required=True, help='degradation rate coefficient, 1/s')
+    watch.add_argument('--output', required=True,
+                       help='output csv file (the results of the new lines are appended to it)')
+    watch.add_argument('--interval', type=float, default=INTERVAL,
+                       help='seconds between two checks of the input file (default: %(default)s)')
+    watch.add_argument('--updates', type=int,
+                       help='number of checks before stopping (default: until Ctrl+C; 1 to process the new lines once)')
+    watch.add_argument('--plot', action='store_true', help='plot the concentrations, updated live (needs matplotlib)')
+    watch.set_defaults(function=watch_command)
+
+    network=commands.add_parser('network', help='route the samples through a network of reaches joined at confluences')
+    network.add_argument('input', help='input csv file')
+    add_field_arguments(network)
+    add_cache_argument(network)
+    network.add_argument('--network', required=True,
+                         help='csv file of the reaches (Reach;From;To;Length (m);Velocity (m/s);k (1/s);Flow (m3/s))')
+    network.add_argument('--source', action='append', default=[], metavar='NODE=FIELD',
+                         help='concentration at a source node: a field of the input csv file or a constant value '
+                              '(repeat for each source)')
+    network.add_argument('--nodes', help='comma-separated nodes to write (default: all the nodes)')
+    network.add_argument('--output', required=True, help='output csv file')
+    network.set_defaults(function=network_command)
+
+    calibrate=commands.add_parser('calibrate', help='estimate k from concentrations measured at the inlet and at the outlet')
+    calibrate.add_argument('--site', action='append', nargs=3, required=True, metavar=('INLET', 'OUTLET', 'DISTANCE'),
+                           help='csv files of the inlet and of the outlet and distance between them, m '
+                                '(repeat for each site)')
+    add_field_arguments(calibrate)
+    calibrate.add_argument('--outlet-time-field',
+                           help='field of date and time of measurement at the outlet (default: as --time-field)')
+    calibrate.add_argument('--compound', action='append', default=[], metavar='FIELD',
+                           help='field of the concentration of a compound, or INLET_FIELD=OUTLET_FIELD '
+                                'if named differently at the outlet (repeat for each compound)')
+    calibrate.add_argument('--method', choices=METHODS, default='loglinear',
+                           help='loglinear (closed form), huber (robust to outliers) or nonlinear '
+                                '(least squares of the concentrations) (default: %(default)s)')
+    calibrate.add_argument('--iterations', type=int, default=ITERATIONS,
+                           help='iterations of the huber and nonlinear methods (default: %(default)s)')
+    calibrate.add_argument('--tolerance', type=float,
+                           help='largest gap (s) between an outlet sample and the arrival of an inlet sample '
+                                '(default: half the median interval between arrivals)')
+    calibrate.add_argument('--output', help='output csv file of the estimates')
+    calibrate.set_defaults(function=calibrate_command)
+
+    sweep_parser=commands.add_parser('sweep', help='simulate the concentration at the outlet for a grid of k values and distances')
+    sweep_parser.add_argument('input', help='input csv file')
+    add_field_arguments(sweep_parser)
+    add_cache_argument(sweep_parser)
+    sweep_parser.add_argument('--conc-field', required=True,
+                       help='field of the concentration measured at the inlet')
+    sweep_parser.add_argument('--k', required=True,
+                       help='degradation rate coefficients, 1/s: comma-separated values or START:STOP:NUM')
+    sweep_parser.add_argument('--distance', required=True,
+                       help='distances covered, m: comma-separated values or START:STOP:NUM')
+    sweep_parser.add_argument('--processes', type=int,
+                       help='number of worker processes (default: one per CPU)')
+    sweep_parser.add_argument('--output', required=True, help='output csv file of the statistics of each scenario')
+    sweep_parser.add_argument('--cube', help='output .npy file of the k x distance x samples concentrations at the outlet')
+    sweep_parser.set_defaults(function=sweep_command)
+
+    uncertainty=commands.add_parser('uncertainty', help='Monte Carlo simulation with uncertain k, distance and velocities')
+    uncertainty.add_argument('input', help='input csv file')
+    add_field_arguments(uncertainty)
+    add_cache_argument(uncertainty)
+    uncertainty.add_argument('--conc-field', required=True,
+                             help='field of the concentration measured at the inlet')
+    uncertainty.add_argument('--k', required=True,
+                             help='distribution of the degradation rate coefficient, 1/s (e.g. normal:1e-4:2e-5, '
+                                  'lognormal:MU:SIGMA, uniform:LOW:HIGH, triangular:LOW:MODE:HIGH or a fixed value)')
+    uncertainty.add_argument('--distance', required=True, help='distribution of the distance covered, m')
+    uncertainty.add_argument('--velocity-factor', default='1',
+                             help='distribution of the multiplicative error of the measured velocities (default: %(default)s)')
+    uncertainty.add_argument('--draws', type=int, default=10000, help='number of draws (default: %(default)s)')
+    uncertainty.add_argument('--percentiles', default='5,50,95',
+                             help='comma-separated percentiles to compute (default: %(default)s)')
+    uncertainty.add_argument('--seed', type=int, help='seed of the random number generator, to reproduce results')
+    uncertainty.add_argument('--output', required=True, help='output csv file')
+    uncertainty.set_defaults(function=uncertainty_command)
+
+    return parser
+
+#The main function is the entry point of the command-line interface; it returns
+#the exit status of the command
+def main(argv=None):
+
+    args=build_parser().parse_args(argv)
+    if args.profile is not None:
+        profiling.enable(args.profile, args.profile_memory)
+    try:
+        args.function(args)
+    except (OSError, KeyError, ValueError) as error:
+        print('Error: %s' % (error.args[0] if isinstance(error, KeyError) else error), file=sys.stderr)
+        return 1
+    return 0
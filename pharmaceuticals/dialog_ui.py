@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+# Form implementation generated from reading ui file 'pharmaceuticals_v0.1.ui'
+#
+# Created by: PyQt5 UI code generator 5.15.11
+#
+# WARNING: Any manual changes made to this file will be lost when pyuic5 is
+# run again.  Do not edit this file unless you know what you are doing.
+
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+
+class Ui_Dialog(object):
+    def setupUi(self, Dialog):
+        Dialog.setObjectName("Dialog")
+        Dialog.resize(411, 330)
+        self.layoutWidget = QtWidgets.QWidget(Dialog)
+        self.layoutWidget.setGeometry(QtCore.QRect(10, 10, 391, 44))
+        self.layoutWidget.setObjectName("layoutWidget")
+        self.load_csv = QtWidgets.QGridLayout(self.layoutWidget)
+        self.load_csv.setContentsMargins(0, 0, 0, 0)
+        self.load_csv.setObjectName("load_csv")
+        self.label = QtWidgets.QLabel(self.layoutWidget)
+        self.label.setObjectName("label")
+        self.load_csv.addWidget(self.label, 0, 0, 1, 1)
+        self.path_bar = QtWidgets.QLineEdit(self.layoutWidget)
+        self.path_bar.setObjectName("path_bar")
+        self.load_csv.addWidget(self.path_bar, 1, 0, 1, 1)
+        self.browse_button = QtWidgets.QPushButton(self.layoutWidget)
+        self.browse_button.setObjectName("browse_button")
+        self.load_csv.addWidget(self.browse_button, 1, 1, 1, 1)
+        self.layoutWidget1 = QtWidgets.QWidget(Dialog)
+        self.layoutWidget1.setGeometry(QtCore.QRect(240, 290, 161, 25))
+        self.layoutWidget1.setObjectName("layoutWidget1")
+        self.gridLayout_2 = QtWidgets.QGridLayout(self.layoutWidget1)
+        self.gridLayout_2.setContentsMargins(0, 0, 0, 0)
+        self.gridLayout_2.setObjectName("gridLayout_2")
+        self.run_button = QtWidgets.QPushButton(self.layoutWidget1)
+        self.run_button.setObjectName("run_button")
+        self.gridLayout_2.addWidget(self.run_button, 0, 0, 1, 1)
+        self.buttonBox = QtWidgets.QDialogButtonBox(self.layoutWidget1)
+        self.buttonBox.setOrientation(QtCore.Qt.Horizontal)
+        self.buttonBox.setStandardButtons(QtWidgets.QDialogButtonBox.Cancel)
+        self.buttonBox.setObjectName("buttonBox")
+        self.gridLayout_2.addWidget(self.buttonBox, 0, 1, 1, 1)
+        self.layoutWidget2 = QtWidgets.QWidget(Dialog)
+        self.layoutWidget2.setGeometry(QtCore.QRect(11, 75, 391, 100))
+        self.layoutWidget2.setObjectName("layoutWidget2")
+        self.gridLayout = QtWidgets.QGridLayout(self.layoutWidget2)
+        self.gridLayout.setContentsMargins(0, 0, 0, 0)
+        self.gridLayout.setObjectName("gridLayout")
+        self.label_2 = QtWidgets.QLabel(self.layoutWidget2)
+        self.label_2.setObjectName("label_2")
+        self.gridLayout.addWidget(self.label_2, 0, 0, 1, 1)
+        self.ID_field = QtWidgets.QComboBox(self.layoutWidget2)
+        self.ID_field.setObjectName("ID_field")
+        self.gridLayout.addWidget(self.ID_field, 0, 1, 1, 1)
+        self.label_3 = QtWidgets.QLabel(self.layoutWidget2)
+        self.label_3.setObjectName("label_3")
+        self.gridLayout.addWidget(self.label_3, 1, 0, 1, 1)
+        self.time_field = QtWidgets.QComboBox(self.layoutWidget2)
+        self.time_field.setObjectName("time_field")
+        self.gridLayout.addWidget(self.time_field, 1, 1, 1, 1)
+        self.label_4 = QtWidgets.QLabel(self.layoutWidget2)
+        self.label_4.setObjectName("label_4")
+        self.gridLayout.addWidget(self.label_4, 2, 0, 1, 1)
+        self.conc_inlet = QtWidgets.QComboBox(self.layoutWidget2)
+        self.conc_inlet.setObjectName("conc_inlet")
+        self.gridLayout.addWidget(self.conc_inlet, 2, 1, 1, 1)
+        self.label_5 = QtWidgets.QLabel(self.layoutWidget2)
+        self.label_5.setObjectName("label_5")
+        self.gridLayout.addWidget(self.label_5, 3, 0, 1, 1)
+        self.v_field = QtWidgets.QComboBox(self.layoutWidget2)
+        self.v_field.setObjectName("v_field")
+        self.gridLayout.addWidget(self.v_field, 3, 1, 1, 1)
+        self.layoutWidget3 = QtWidgets.QWidget(Dialog)
+        self.layoutWidget3.setGeometry(QtCore.QRect(10, 200, 291, 22))
+        self.layoutWidget3.setObjectName("layoutWidget3")
+        self.gridLayout_3 = QtWidgets.QGridLayout(self.layoutWidget3)
+        self.gridLayout_3.setContentsMargins(0, 0, 0, 0)
+        self.gridLayout_3.setObjectName("gridLayout_3")
+        self.label_6 = QtWidgets.QLabel(self.layoutWidget3)
+        self.label_6.setObjectName("label_6")
+        self.gridLayout_3.addWidget(self.label_6, 0, 0, 1, 1)
+        self.distance = QtWidgets.QLineEdit(self.layoutWidget3)
+        self.distance.setObjectName("distance")
+        self.gridLayout_3.addWidget(self.distance, 0, 1, 1, 1)
+        self.progress_bar = QtWidgets.QProgressBar(Dialog)
+        self.progress_bar.setGeometry(QtCore.QRect(10, 291, 141, 23))
+        self.progress_bar.setProperty("value", 0)
+        self.progress_bar.setObjectName("progress_bar")
+        self.stop_button = QtWidgets.QPushButton(Dialog)
+        self.stop_button.setGeometry(QtCore.QRect(160, 290, 71, 25))
+        self.stop_button.setObjectName("stop_button")
+        self.calibrate_button = QtWidgets.QPushButton(Dialog)
+        self.calibrate_button.setGeometry(QtCore.QRect(345, 239, 56, 25))
+        self.calibrate_button.setObjectName("calibrate_button")
+        self.integrate_velocity = QtWidgets.QCheckBox(Dialog)
+        self.integrate_velocity.setGeometry(QtCore.QRect(310, 200, 91, 22))
+        self.integrate_velocity.setObjectName("integrate_velocity")
+        self.layoutWidget_2 = QtWidgets.QWidget(Dialog)
+        self.layoutWidget_2.setGeometry(QtCore.QRect(10, 240, 331, 22))
+        self.layoutWidget_2.setObjectName("layoutWidget_2")
+        self.gridLayout_4 = QtWidgets.QGridLayout(self.layoutWidget_2)
+        self.gridLayout_4.setContentsMargins(0, 0, 0, 0)
+        self.gridLayout_4.setObjectName("gridLayout_4")
+        self.label_7 = QtWidgets.QLabel(self.layoutWidget_2)
+        self.label_7.setObjectName("label_7")
+        self.gridLayout_4.addWidget(self.label_7, 0, 0, 1, 1)
+        self.degradation = QtWidgets.QLineEdit(self.layoutWidget_2)
+        self.degradation.setObjectName("degradation")
+        self.gridLayout_4.addWidget(self.degradation, 0, 1, 1, 1)
+
+        self.retranslateUi(Dialog)
+        self.buttonBox.accepted.connect(Dialog.accept) # type: ignore
+        self.buttonBox.rejected.connect(Dialog.reject) # type: ignore
+        QtCore.QMetaObject.connectSlotsByName(Dialog)
+
+    def retranslateUi(self, Dialog):
+        _translate = QtCore.QCoreApplication.translate
+        Dialog.setWindowTitle(_translate("Dialog", "Pharmaceuticals"))
+        self.label.setText(_translate("Dialog", "Load csv file of pharmaceuticals concentration:"))
+        self.browse_button.setText(_translate("Dialog", "Browse..."))
+        self.run_button.setText(_translate("Dialog", "Run"))
+        self.label_2.setText(_translate("Dialog", "Sample ID:"))
+        self.label_3.setText(_translate("Dialog", "Measurement time (YYYY-mm-dd hh:mm:ss):"))
+        self.label_4.setText(_translate("Dialog", "Concentration measured at the inlet:"))
+        self.label_5.setText(_translate("Dialog", "Average velocity of water in the stream (m/s):"))
+        self.label_6.setText(_translate("Dialog", "Distance between the inlet and the outlet (m):"))
+        self.stop_button.setText(_translate("Dialog", "Stop"))
+        self.calibrate_button.setToolTip(_translate("Dialog", "Estimate k from concentrations measured at the outlet"))
+        self.calibrate_button.setText(_translate("Dialog", "Fit k..."))
+        self.integrate_velocity.setToolTip(_translate("Dialog", "Follow the velocities measured during the transit (instead of the velocity of each sample)"))
+        self.integrate_velocity.setText(_translate("Dialog", "Varying v"))
+        self.label_7.setText(_translate("Dialog", "Degradation rate coefficient for pharmaceutical (1/s):"))
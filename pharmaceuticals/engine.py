@@ -0,0 +1,175 @@
+"""
+/***************************************************************************
+ pharmaceuticals - engine
+
+ Simulation engine of the pharmaceuticals tool, independent of Qt.
+ The concentration at the outlet is simulated as:
+ C_oulet = C_inlet * exp[-(k*t)],
+ where: C_inlet is the measured pharmaceutical's concentration at the inlet
+        k is the degradation rate coefficient for pharmaceutical (1/s)
+        t is the travel time (s) of the sample collected at the inlet until
+        the outlet, i.e. distance/velocity
+ All the computations are made on whole numpy arrays at once.
+
+ With integrate=True the travel time follows the velocity as it changes during
+ the transit: the velocities measured over time (taken as varying linearly
+ between two measurements) are integrated into the distance travelled since
+ the first measurement, X(t), and each sample reaches the outlet when
+ X(t)=X(t_sample)+distance. X is sorted, so that the arrival of all the samples
+ is found by a single binary search (numpy.searchsorted), O(n log n).
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+#Importing namedtuple to return the results of a simulation
+from collections import namedtuple
+
+#Importing numpy for the vectorized computations
+import numpy
+
+from pharmaceuticals.profiling import stage
+from pharmaceuticals.reader import to_timestamps
+
+#The SimulationResult tuple holds the results of a simulation:
+#travel_time  -> travel time (s) of each sample from the inlet to the outlet
+#arrival_time -> date and time (datetime64) when each sample reaches the outlet
+#outlet_conc  -> simulated pharmaceutical's concentration at the outlet
+SimulationResult=namedtuple('SimulationResult', ['travel_time', 'arrival_time', 'outlet_conc'])
+
+#The CompoundsResult tuple holds the results of a simulation of many compounds:
+#compounds    -> list of the names of the compounds (fields of the csv file)
+#travel_time  -> travel time (s) of each sample from the inlet to the outlet
+#arrival_time -> date and time (datetime64) when each sample reaches the outlet
+#outlet_conc  -> simulated concentrations at the outlet (compounds x samples array)
+CompoundsResult=namedtuple('CompoundsResult', ['compounds', 'travel_time', 'arrival_time', 'outlet_conc'])
+
+#The as_timestamps function returns date and time of measurement as a datetime64
+#array (strings in the YYYY-mm-dd hh:mm:ss format are converted)
+def as_timestamps(date_time):
+
+    date_time=numpy.asarray(date_time)
+    if date_time.dtype.kind!='M':
+        date_time=to_timestamps(date_time)
+    return date_time
+
+#The travel_times function returns the travel time (s) of each sample, given the
+#distance (m) covered and the average velocity of the stream (m/s) at the inlet
+def travel_times(velocity, distance):
+
+    velocity=numpy.asarray(velocity, dtype=numpy.float64)
+    if numpy.any(velocity==0):
+        raise ValueError('The average velocity of the stream must not be zero')
+    return numpy.float64(distance)/velocity
+
+#The integrated_travel_times function returns the travel time (s) of each sample
+#following the velocities of the stream (m/s) measured at the dates and times
+#date_time during its transit, for the distance (m) covered. Samples which do not
+#reach the outlet before the last measurement keep the last velocity from then
+#on (or, with extrapolate=False, get NaN travel times)
+def integrated_travel_times(velocity, date_time, distance, extrapolate=True):
+
+    velocity=numpy.asarray(velocity, dtype=numpy.float64)
+    start=as_timestamps(date_time).astype('datetime64[us]')
+    if not len(velocity):
+        return numpy.zeros(0)
+    if not (velocity>0).all():
+        raise ValueError('The average velocity of the stream must be greater than zero to be integrated')
+    if len(velocity)<2:
+        #A single measurement: no change of velocity to follow
+        return numpy.full(len(velocity), numpy.float64(distance)/velocity[0] if extrapolate else numpy.nan)
+    #Times of measurement (s) in order; samples in the same order are not copied
+    seconds=(start-start[0]).astype(numpy.float64)/1e6
+    order=None
+    if (numpy.diff(seconds)<0).any():
+        order=numpy.argsort(seconds, kind='stable')
+        seconds, velocity=seconds[order], velocity[order]
+
+    #Distance travelled at each time of measurement (trapezoidal rule)
+    step=numpy.diff(seconds)
+    travelled=numpy.zeros(len(seconds))
+    numpy.cumsum((velocity[1:]+velocity[:-1])/2*step, out=travelled[1:])
+    target=travelled+numpy.float64(distance)
+
+    #Interval [j-1, j] of the measurements in which each sample reaches the outlet
+    j=numpy.searchsorted(travelled, target)
+    inside=j<len(seconds)
+    j=numpy.where(inside, j, len(seconds)-1)
+    #Inside the interval the velocity is v0+slope*tau, so that the distance
+    #left is covered when v0*tau+slope/2*tau**2=left (numerically stable root)
+    v0=velocity[j-1]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        slope=(velocity[j]-v0)/step[j-1]
+        left=target-travelled[j-1]
+        tau=2*left/(v0+numpy.sqrt(v0*v0+2*slope*left))
+        arrival=numpy.where(inside, seconds[j-1]+tau,
+                            seconds[-1]+(target-travelled[-1])/velocity[-1] if extrapolate else numpy.nan)
+    travel_time=arrival-seconds
+    if order is not None:
+        travel_time[order]=travel_time.copy()
+    return travel_time
+
+#The arrival_times function returns date and time when each sample reaches the
+#outlet, i.e. date and time of measurement shifted by the travel time.
+#Travel times are rounded to the microsecond (as timedelta does), so arrival
+#times are datetime64[us] values keeping fractions of a second
+def arrival_times(date_time, travel_time):
+
+    date_time=as_timestamps(date_time)
+    shift=numpy.rint(numpy.asarray(travel_time, dtype=numpy.float64)*1e6).astype('timedelta64[us]')
+    return date_time.astype('datetime64[us]')+shift
+
+#The decay function returns the simulated concentration at the outlet, given the
+#measured concentration at the inlet, the degradation rate coefficient k (1/s)
+#and the travel time (s)
+def decay(inlet_conc, k, travel_time):
+
+    inlet_conc=numpy.asarray(inlet_conc, dtype=numpy.float64)
+    return inlet_conc*numpy.exp(-numpy.float64(k)*numpy.asarray(travel_time, dtype=numpy.float64))
+
+#The simulate function runs the whole model on arrays of measured concentrations
+#at the inlet, average velocities and dates and times of measurement, for a
+#given distance (m) and degradation rate coefficient k (1/s). With integrate=True
+#travel times follow the velocities measured during the transit
+#(integrated_travel_times) instead of the velocity of each sample
+def simulate(inlet_conc, velocity, date_time, distance, k, integrate=False):
+
+    with stage('simulate', len(velocity)):
+        if integrate:
+            travel_time=integrated_travel_times(velocity, date_time, distance)
+        else:
+            travel_time=travel_times(velocity, distance)
+        arrival_time=arrival_times(date_time, travel_time)
+        outlet_conc=decay(inlet_conc, k, travel_time)
+    return SimulationResult(travel_time, arrival_time, outlet_conc)
+
+#The simulate_compounds function runs the model for many compounds at once.
+#inlet_concs is a dictionary compound -> measured concentrations at the inlet and
+#k_values is a dictionary compound -> degradation rate coefficient k (1/s).
+#Travel and arrival times are computed only once and shared by all the compounds
+#(with integrate as in simulate)
+def simulate_compounds(inlet_concs, velocity, date_time, distance, k_values, integrate=False):
+
+    compounds=list(k_values)
+    with stage('simulate_compounds', len(velocity)):
+        if integrate:
+            travel_time=integrated_travel_times(velocity, date_time, distance)
+        else:
+            travel_time=travel_times(velocity, distance)
+        arrival_time=arrival_times(date_time, travel_time)
+        #compounds x samples array of the concentrations at the inlet
+        inlet_conc=numpy.empty((len(compounds), len(travel_time)), dtype=numpy.float64)
+        for i, compound in enumerate(compounds):
+            inlet_conc[i]=inlet_concs[compound]
+        #Column vector of the degradation rate coefficients, broadcast over the samples
+        k=numpy.array([k_values[compound] for compound in compounds], dtype=numpy.float64)[:, numpy.newaxis]
+        outlet_conc=inlet_conc*numpy.exp(-k*travel_time)
+    return CompoundsResult(compounds, travel_time, arrival_time, outlet_conc)
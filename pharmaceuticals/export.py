@@ -0,0 +1,434 @@
+"""
+/***************************************************************************
+ pharmaceuticals - export
+
+ Writing of the simulated results to output files, in bulk straight from the
+ result arrays:
+
+ csv -> the values are formatted a column at a time (timestamps by integer
+        arithmetic on the whole array) and written BLOCK_ROWS lines at a time
+ npy -> a folder with one .npy file per column (sample_id.npy, date_time.npy,
+        travel_time.npy, arrival_time.npy, inlet_conc.npy, outlet_conc.npy),
+        the raw data of the arrays appended a chunk after the other; each
+        column is read back with numpy.load (also memory-mapped, with
+        mmap_mode='r')
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+#Importing the csv module to manage csv files
+import csv
+import os
+import struct
+
+import numpy
+
+from pharmaceuticals.profiling import stage
+from pharmaceuticals.reader import DELIMITER
+
+#Headers of the fields of the output csv file
+OUTPUT_HEADERS=['Sample ID', 'Date and Time', 'Travel time (s)', 'Arrival time',
+                'Concentration at the inlet', 'Concentration at the outlet']
+
+#Names of the .npy files of the output columns (in the order of OUTPUT_HEADERS)
+OUTPUT_COLUMNS=['sample_id', 'date_time', 'travel_time', 'arrival_time', 'inlet_conc', 'outlet_conc']
+
+#Formats of the output files: csv -> one csv file, npy -> a folder with one
+#.npy file per column (read back with numpy.load)
+FORMATS=['csv', 'npy']
+
+#Number of rows formatted and written at a time
+BLOCK_ROWS=65536
+
+#Number of digits of the fractions of a second of the units of datetime64
+#formatted by format_timestamps without numpy.datetime_as_string
+FRACTION_DIGITS={'s': 0, 'ms': 3, 'us': 6}
+
+#Characters of the numbers 00 to 99, to write two digits at a time
+DIGIT_PAIRS=numpy.array([b'%02d' % number for number in range(100)])
+
+#Size (bytes) of the headers of the .npy files written a block at a time: room
+#enough for any shape, so that the header can be rewritten in place at the end
+NPY_HEADER_SIZE=128
+
+#The format_timestamps function converts a datetime64 array into strings
+#in the YYYY-mm-dd hh:mm:ss format of the input csv file
+def format_timestamps(date_time):
+
+    date_time=numpy.asarray(date_time)
+    chars=timestamp_chars(date_time.ravel())
+    if chars is None:
+        #NaT is written as it is (only the T between date and time is replaced)
+        return numpy.where(numpy.isnat(date_time), 'NaT',
+                           numpy.char.replace(numpy.datetime_as_string(date_time), 'T', ' '))
+    return chars.view('S%d' % chars.shape[1]).reshape(date_time.shape).astype(str)
+
+#The timestamp_chars function returns the characters of a one-dimensional
+#datetime64 array as formatted by format_timestamps (one row of bytes per
+#timestamp, followed by the bytes of end), or None if it cannot be formatted
+#here (units not in FRACTION_DIGITS, NaT or years outside 1-9999). The digits
+#are worked out with integer arithmetic on the whole array (days to dates as
+#in H. Hinnant's civil_from_days), which is much faster than
+#numpy.datetime_as_string and gives the same strings
+def timestamp_chars(date_time, end=b''):
+
+    unit, count=numpy.datetime_data(date_time.dtype) if date_time.dtype.kind=='M' else (None, 0)
+    if unit not in FRACTION_DIGITS or count!=1 or numpy.isnat(date_time).any():
+        return None
+    digits=FRACTION_DIGITS[unit]
+    seconds, fraction=numpy.divmod(date_time.astype(numpy.int64), 10**digits)
+    days, seconds=numpy.divmod(seconds, 86400)
+
+    #Days since 1970-01-01 -> year, month and day
+    days=days+719468
+    era=numpy.floor_divide(days, 146097)
+    day_of_era=days-era*146097
+    year_of_era=(day_of_era-day_of_era//1460+day_of_era//36524-day_of_era//146096)//365
+    day_of_year=day_of_era-(365*year_of_era+year_of_era//4-year_of_era//100)
+    month=(5*day_of_year+2)//153
+    day=day_of_year-(153*month+2)//5+1
+    month=numpy.where(month<10, month+3, month-9)
+    year=year_of_era+era*400+(month<=2)
+    if len(year) and (year.min()<1 or year.max()>9999):
+        return None
+
+    #One row of characters per timestamp, filled two digits at a time
+    width=19+(digits+1 if digits else 0)
+    size=len(year)
+    chars=numpy.empty((size, width+len(end)), dtype=numpy.uint8)
+    hours, seconds=numpy.divmod(seconds, 3600)
+    minutes, seconds=numpy.divmod(seconds, 60)
+    pairs=[(year//100, 0), (year%100, 2), (month, 5), (day, 8), (hours, 11), (minutes, 14), (seconds, 17)]
+    for position in range(width-2, 20+digits%2-1, -2):
+        pairs.append((fraction%100, position))
+        fraction=fraction//100
+    for values, position in pairs:
+        chars[:, position:position+2]=DIGIT_PAIRS[values].view(numpy.uint8).reshape(size, 2)
+    if digits%2:
+        chars[:, 20]=fraction+48
+    for position, separator in ((4, b'-'), (7, b'-'), (10, b' '), (13, b':'), (16, b':'), (19, b'.')):
+        if position<width:
+            chars[:, position]=ord(separator)
+    chars[:, width:]=numpy.frombuffer(end, dtype=numpy.uint8)
+    return chars
+
+#The format_column function converts an array into the strings of its values
+#in a csv file (as written by the csv module, with quotes only where needed)
+def format_column(values, delimiter=DELIMITER):
+
+    values=numpy.asarray(values)
+    kind=values.dtype.kind
+    if kind=='M':
+        #One line per timestamp, split into strings at once
+        chars=timestamp_chars(values.ravel(), b'\n')
+        if chars is None:
+            return format_timestamps(values).tolist()
+        return chars.tobytes().decode('ascii').split('\n')[:-1]
+    if kind=='f':
+        return list(map(repr, values.tolist()))
+    if kind in 'iub':
+        return list(map(str, values.tolist()))
+    if kind=='U':
+        strings=values.tolist()
+    elif kind=='S':
+        strings=values.astype(str).tolist()
+    else:
+        strings=['' if value is None else str(value) for value in values.tolist()]
+    #Quotes are looked for in all the strings at once
+    text=''.join(strings)
+    if delimiter in text or '"' in text or '\n' in text or '\r' in text:
+        special=(delimiter, '"', '\n', '\r')
+        strings=['"%s"' % string.replace('"', '""') if any(char in string for char in special) else string
+                 for string in strings]
+    return strings
+
+#The write_columns function writes columns of values (arrays of the same length)
+#to a csv file already open, one row per element, BLOCK_ROWS rows at a time:
+#each block is formatted column by column and written with a single call
+def write_columns(outputfile, columns, delimiter=DELIMITER):
+
+    columns=[numpy.asarray(values) for values in columns]
+    size=len(columns[0]) if columns else 0
+    with stage('write', size):
+        for start in range(0, size, BLOCK_ROWS):
+            block=[format_column(values[start:start+BLOCK_ROWS], delimiter) for values in columns]
+            outputfile.write('\r\n'.join(map(delimiter.join, zip(*block)))+'\r\n')
+
+#The write_table function writes a csv file with a line of headers and the
+#columns of values below
+def write_table(path, headers, columns, delimiter=DELIMITER):
+
+    with open(path, 'w', newline='') as outputfile:
+        csv.writer(outputfile, delimiter=delimiter).writerow(headers)
+        write_columns(outputfile, columns, delimiter)
+
+#The result_columns function returns the output columns of the results of a
+#simulation (in the order of OUTPUT_HEADERS)
+def result_columns(sample_id, date_time, inlet_conc, result):
+
+    return [numpy.asarray(sample_id), numpy.asarray(date_time), result.travel_time, result.arrival_time,
+            numpy.asarray(inlet_conc, dtype=numpy.float64), result.outlet_conc]
+
+#The csv_result_columns function returns the output columns of the results of a
+#simulation as written to csv files: dates and times of measurement in whole
+#seconds are written as in the input csv file (YYYY-mm-dd hh:mm:ss) and the
+#others to the microsecond (as arrival times), whatever the other values of the
+#same chunk, so that the output does not depend on the size of the chunks
+def csv_result_columns(sample_id, date_time, inlet_conc, result):
+
+    columns=result_columns(sample_id, date_time, inlet_conc, result)
+    date_time=columns[1]
+    if date_time.dtype.kind=='M' and numpy.datetime_data(date_time.dtype)[0] not in ('Y', 'M', 'W', 'D', 'h', 'm', 's'):
+        date_time=date_time.astype('datetime64[us]')
+        strings=format_timestamps(date_time)
+        columns[1]=numpy.where(date_time.astype(numpy.int64)%10**6==0, strings.astype('U19'), strings)
+    return columns
+
+#The write_csv function writes the results of a simulation to a csv file with
+#one row per sample (sample ID, measurement time, travel time, arrival time,
+#concentration at the inlet and simulated concentration at the outlet)
+def write_csv(path, sample_id, date_time, inlet_conc, result, delimiter=DELIMITER):
+
+    write_table(path, OUTPUT_HEADERS, csv_result_columns(sample_id, date_time, inlet_conc, result), delimiter)
+
+#The write_csv_rows function writes the rows of the results of a simulation
+#to a csv file already open (e.g. to append one chunk after the other)
+def write_csv_rows(outputfile, sample_id, date_time, inlet_conc, result, delimiter=DELIMITER):
+
+    write_columns(outputfile, csv_result_columns(sample_id, date_time, inlet_conc, result), delimiter)
+
+#The write_results function writes the results of a simulation in one of FORMATS
+#(a csv file, or a folder of .npy files named as in OUTPUT_COLUMNS)
+def write_results(path, sample_id, date_time, inlet_conc, result, output_format='csv', delimiter=DELIMITER):
+
+    with ResultWriter(path, output_format, delimiter) as writer:
+        writer.write(sample_id, date_time, inlet_conc, result)
+
+#Suffix of the files being written, renamed to their own name only once complete
+TEMPORARY_SUFFIX='.tmp'
+
+#The ResultWriter class writes the results of a simulation in one of FORMATS a
+#piece after the other (e.g. one chunk of the input file at a time). The results
+#are written to temporary files which replace the output only when the writer is
+#closed, so that a run which fails (e.g. on an invalid value of the input file)
+#leaves any former output as it was
+class ResultWriter(object):
+
+    def __init__(self, path, output_format='csv', delimiter=DELIMITER):
+
+        if output_format not in FORMATS:
+            raise ValueError("Unknown format '%s' (choose from %s)" % (output_format, ', '.join(FORMATS)))
+        self.path=path
+        self.delimiter=delimiter
+        self.outputfile=None
+        self.columns=None
+        if output_format=='npy':
+            self.columns=NpyColumnWriter(path, OUTPUT_COLUMNS)
+        else:
+            self.outputfile=open(path+TEMPORARY_SUFFIX, 'w', newline='')
+            csv.writer(self.outputfile, delimiter=delimiter).writerow(OUTPUT_HEADERS)
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+
+        if error_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def write(self, sample_id, date_time, inlet_conc, result):
+
+        if self.columns is not None:
+            self.columns.append(result_columns(sample_id, date_time, inlet_conc, result))
+        else:
+            write_csv_rows(self.outputfile, sample_id, date_time, inlet_conc, result, self.delimiter)
+
+    #The close method completes the output, replacing any former output
+    def close(self):
+
+        if self.columns is not None:
+            self.columns.close()
+        if self.outputfile is not None:
+            self.outputfile.close()
+            self.outputfile=None
+            os.replace(self.path+TEMPORARY_SUFFIX, self.path)
+
+    #The discard method removes what has been written, leaving any former output
+    def discard(self):
+
+        if self.columns is not None:
+            self.columns.discard()
+        if self.outputfile is not None:
+            self.outputfile.close()
+            self.outputfile=None
+            os.remove(self.path+TEMPORARY_SUFFIX)
+
+#The NpyColumnWriter class writes columns of values to a folder, one .npy file
+#per column, appending a block of rows after the other: the data of each block
+#go straight from the arrays to the files, and the headers (with the number of
+#rows) are written when the writer is closed. Columns of strings are widened
+#(rewriting what has been written so far) when a block has longer strings.
+#As ResultWriter, the columns are written to temporary files which replace the
+#.npy files only when the writer is closed
+class NpyColumnWriter(object):
+
+    def __init__(self, directory, names):
+
+        os.makedirs(directory, exist_ok=True)
+        self.paths=[os.path.join(directory, name+'.npy') for name in names]
+        self.files=[None]*len(names)
+        self.dtypes=[None]*len(names)
+        self.rows=0
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+
+        if error_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def append(self, columns):
+
+        columns=[numpy.asarray(values) for values in columns]
+        size=len(columns[0]) if columns else 0
+        with stage('write', size):
+            for i, values in enumerate(columns):
+                if values.dtype.kind=='O':
+                    values=values.astype(str)
+                if self.files[i] is None:
+                    self.files[i]=open(self.paths[i]+TEMPORARY_SUFFIX, 'wb+')
+                    self.files[i].write(npy_header(values.dtype, 0))
+                    self.dtypes[i]=values.dtype
+                elif values.dtype!=self.dtypes[i]:
+                    self.widen(i, values.dtype)
+                    values=values.astype(self.dtypes[i])
+                numpy.ascontiguousarray(values).tofile(self.files[i])
+            self.rows+=size
+
+    #The widen method rewrites a column so that it can hold the values of dtype
+    #too: columns of strings get room for the longer strings (at least twice the
+    #former room, so that they are seldom rewritten), columns of dates and times
+    #get the finer unit (so that fractions of a second are never cut)
+    def widen(self, i, dtype):
+
+        old=self.dtypes[i]
+        if dtype.kind==old.kind=='M':
+            new=numpy.promote_types(old, dtype)
+        elif dtype.kind==old.kind and dtype.kind in 'SU' and dtype.itemsize>old.itemsize:
+            new=numpy.dtype((old.type, max(dtype.itemsize, 2*old.itemsize)//numpy.dtype((old.type, 1)).itemsize))
+        else:
+            return
+        if new==old:
+            return
+        outputfile=self.files[i]
+        outputfile.seek(NPY_HEADER_SIZE)
+        values=numpy.fromfile(outputfile, dtype=old, count=self.rows)
+        outputfile.seek(NPY_HEADER_SIZE)
+        values.astype(new).tofile(outputfile)
+        self.dtypes[i]=new
+
+    def close(self):
+
+        for i, outputfile in enumerate(self.files):
+            if outputfile is not None:
+                outputfile.seek(0)
+                outputfile.write(npy_header(self.dtypes[i], self.rows))
+                outputfile.close()
+                os.replace(self.paths[i]+TEMPORARY_SUFFIX, self.paths[i])
+        self.files=[None]*len(self.files)
+
+    #The discard method removes the columns written so far, leaving any former
+    #.npy files as they were
+    def discard(self):
+
+        for i, outputfile in enumerate(self.files):
+            if outputfile is not None:
+                outputfile.close()
+                os.remove(self.paths[i]+TEMPORARY_SUFFIX)
+        self.files=[None]*len(self.files)
+
+#The npy_header function returns the header (version 1.0, NPY_HEADER_SIZE bytes)
+#of a .npy file holding a one-dimensional array of rows values of dtype
+def npy_header(dtype, rows):
+
+    header="{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (numpy.lib.format.dtype_to_descr(dtype), rows)
+    header=header.ljust(NPY_HEADER_SIZE-11)+'\n'
+    return b'\x93NUMPY\x01\x00'+struct.pack('<H', len(header))+header.encode('latin1')
+
+#The write_compounds_csv function writes the results of a simulation of many
+#compounds to a csv file with one row per sample and one field per compound
+#holding the simulated concentration at the outlet
+def write_compounds_csv(path, sample_id, date_time, result, delimiter=DELIMITER):
+
+    write_table(path, OUTPUT_HEADERS[:4]+['%s at the outlet' % compound for compound in result.compounds],
+                [sample_id, date_time, result.travel_time, result.arrival_time]+list(result.outlet_conc), delimiter)
+
+#The write_network_csv function writes the results of the routing through a
+#network to a csv file with one row per sample and, for each node, the arrival
+#time and the simulated concentration at the node
+def write_network_csv(path, sample_id, date_time, result, delimiter=DELIMITER):
+
+    headers=OUTPUT_HEADERS[:2]
+    for node in result.nodes:
+        headers=headers+['Arrival time at %s' % node, 'Concentration at %s' % node]
+    columns=[sample_id, date_time]
+    for arrival_time, conc in zip(result.arrival_time, result.conc):
+        columns+=[arrival_time, conc]
+    write_table(path, headers, columns, delimiter)
+
+#The write_summary_csv function writes the summary table of a batch to a csv
+#file with one row per input csv file (a FileSummary of pharmaceuticals.batch)
+def write_summary_csv(path, summaries, delimiter=DELIMITER):
+
+    with open(path, 'w', newline='') as outputfile:
+        csvWriter=csv.writer(outputfile, delimiter=delimiter)
+        csvWriter.writerow(['Site', 'Input file', 'Output file', 'Samples', 'Mean concentration at the outlet',
+                            'Minimum concentration at the outlet', 'Maximum concentration at the outlet',
+                            'Time (s)', 'Error'])
+        csvWriter.writerows(['' if value is None else value for value in summary] for summary in summaries)
+
+#The write_calibration_csv function writes the estimates of k to a csv file with
+#one row per site and compound (a CalibrationResult of pharmaceuticals.calibration)
+def write_calibration_csv(path, sites, compounds, result, delimiter=DELIMITER):
+
+    with open(path, 'w', newline='') as outputfile:
+        csvWriter=csv.writer(outputfile, delimiter=delimiter)
+        csvWriter.writerow(['Site', 'Compound', 'k (1/s)', 'Standard error of k (1/s)', 'Pairs',
+                            'RMSE of the concentration at the outlet'])
+        csvWriter.writerows(zip(sites, compounds, result.k.tolist(), result.stderr.tolist(),
+                                result.pairs.tolist(), result.rmse.tolist()))
+
+#The write_sweep_csv function writes the summary statistics of a parameter sweep
+#to a csv file with one row per scenario (k, distance)
+def write_sweep_csv(path, result, delimiter=DELIMITER):
+
+    k, distance=numpy.meshgrid(result.k, result.distance, indexing='ij')
+    write_table(path, ['k (1/s)', 'Distance (m)', 'Mean concentration at the outlet',
+                       'Minimum concentration at the outlet', 'Maximum concentration at the outlet',
+                       'Standard deviation of the concentration at the outlet'],
+                [values.ravel() for values in (k, distance, result.mean, result.minimum, result.maximum, result.std)],
+                delimiter)
+
+#The write_percentiles_csv function writes the percentiles of the concentrations
+#at the outlet given by a Monte Carlo simulation to a csv file with one row per sample
+def write_percentiles_csv(path, sample_id, date_time, result, delimiter=DELIMITER):
+
+    write_table(path, OUTPUT_HEADERS[:2]+['Percentile %g of the concentration at the outlet' % percentile
+                                          for percentile in result.percentiles],
+                [sample_id, date_time]+list(result.outlet_conc.T), delimiter)
@@ -0,0 +1,201 @@
+"""
+/***************************************************************************
+ pharmaceuticals - figures
+
+ Offscreen rendering of the figures of many results to image files (png, svg
+ or pdf), unattended and with no display: the figures are drawn by the Agg
+ backend of matplotlib through its object-oriented interface (no pyplot and
+ no global state), so that any number of them can be rendered e.g. for
+ reports or by nightly jobs on headless machines.
+
+ python -m pharmaceuticals figures out/*_outlet.csv --output-dir figures
+
+ Each process builds the figure (axes, lines, labels and legend) only once, as
+ a FigureTemplate, and for each site or compound just sets the data of the
+ lines and saves the figure again. Result files are rendered in parallel by a
+ pool of processes, one file per task; a result file of many compounds (as
+ written by the compounds command) gives one figure per compound.
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import re
+import time
+from collections import namedtuple
+
+import numpy
+
+from matplotlib import dates
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from pharmaceuticals.export import OUTPUT_COLUMNS, OUTPUT_HEADERS
+from pharmaceuticals.plotting import MAX_BUCKETS, minmax_indices
+from pharmaceuticals.pool import error_message, run_tasks
+from pharmaceuticals.profiling import stage
+from pharmaceuticals.reader import DELIMITER, read_columns
+
+#Formats of the image files
+FORMATS=['png', 'svg', 'pdf']
+
+#Default size (inches) and resolution (dots per inch) of the figures
+SIZE=(10.0, 6.0)
+DPI=100
+
+#Suffix of the fields of the concentrations at the outlet of many compounds
+COMPOUND_SUFFIX=' at the outlet'
+
+#The FigureSummary tuple holds the outcome of the rendering of a result file:
+#inputfile   -> path of the result file (csv file, or folder of .npy files)
+#outputfiles -> paths of the image files written (one per site or compound)
+#seconds     -> time spent on the file (s)
+#error       -> error message (None if the file was rendered)
+FigureSummary=namedtuple('FigureSummary', ['inputfile', 'outputfiles', 'seconds', 'error'])
+
+#The FigureTemplate class holds a figure of the concentrations measured at the
+#inlet and simulated at the outlet vs time, built once and drawn again for each
+#series by setting the data of its lines. Long series are downsampled keeping the
+#minimum and the maximum of each bucket (as the plots of the Dialog)
+class FigureTemplate(object):
+
+    def __init__(self, size=SIZE, dpi=DPI, max_buckets=MAX_BUCKETS):
+
+        self.figure=Figure(figsize=size, dpi=dpi)
+        FigureCanvasAgg(self.figure)
+        self.axes=self.figure.add_subplot()
+        self.axes.xaxis_date()
+        self.axes.xaxis.set_major_formatter(dates.DateFormatter('%Y-%m-%d %H:%M:%S'))
+        self.axes.tick_params(axis='x', labelrotation=30)
+        for label in self.axes.get_xticklabels():
+            label.set_horizontalalignment('right')
+        self.axes.set_xlabel('Time')
+        self.inlet,=self.axes.plot([], [], label='Concentration measured at the inlet')
+        self.outlet,=self.axes.plot([], [], label='Concentration simulated at the outlet')
+        self.figure.subplots_adjust(bottom=0.2)
+        self.max_buckets=max_buckets
+
+    #The render method draws the series (date and time, concentration) of the
+    #inlet (None to leave it out) and of the outlet and saves the figure to path
+    #(in the format given by its extension)
+    def render(self, path, inlet, outlet, title='', ylabel='Concentration'):
+
+        with stage('figure', len(outlet[1])):
+            lines=[]
+            for line, series in ((self.inlet, inlet), (self.outlet, outlet)):
+                line.set_visible(series is not None)
+                if series is None:
+                    continue
+                x=dates.date2num(numpy.asarray(series[0]))
+                y=numpy.asarray(series[1], dtype=numpy.float64)
+                indices=minmax_indices(y, self.max_buckets)
+                line.set_data(x[indices], y[indices])
+                lines.append(line)
+            self.axes.set_title(title)
+            self.axes.set_ylabel(ylabel)
+            self.axes.legend(handles=lines, loc='upper right')
+            self.axes.relim(visible_only=True)
+            self.axes.autoscale_view()
+            self.figure.savefig(path)
+
+#Templates of the figures of this process, by size and resolution (so that each
+#worker process builds its figure only once)
+TEMPLATES={}
+
+#The figure_template function returns the FigureTemplate of this process for a
+#size and a resolution
+def figure_template(size=SIZE, dpi=DPI):
+
+    key=(tuple(size), dpi)
+    if key not in TEMPLATES:
+        TEMPLATES[key]=FigureTemplate(size, dpi)
+    return TEMPLATES[key]
+
+#The read_results function reads a result file, i.e. a csv file or a folder of
+#.npy files written by pharmaceuticals.export, and returns the list of its series
+#as (compound, inlet, outlet): compound is None for the results of a single
+#compound, inlet and outlet are (date and time, concentration) or None
+def read_results(path, delimiter=DELIMITER):
+
+    if os.path.isdir(path):
+        columns=dict((name, numpy.load(os.path.join(path, name+'.npy'), mmap_mode='r')) for name in OUTPUT_COLUMNS)
+        return [(None, (columns['date_time'], columns['inlet_conc']), (columns['arrival_time'], columns['outlet_conc']))]
+    table=read_columns(path, delimiter=delimiter)
+    arrival_time=table.timestamps(OUTPUT_HEADERS[3])
+    if OUTPUT_HEADERS[5] in table:
+        return [(None, (table.timestamps(OUTPUT_HEADERS[1]), table.numbers(OUTPUT_HEADERS[4])),
+                 (arrival_time, table.numbers(OUTPUT_HEADERS[5])))]
+    compounds=[header for header in table.headers if header.endswith(COMPOUND_SUFFIX)]
+    if not compounds:
+        raise ValueError("No field '%s' nor '...%s' in the csv file" % (OUTPUT_HEADERS[5], COMPOUND_SUFFIX))
+    return [(header[:-len(COMPOUND_SUFFIX)], None, (arrival_time, table.numbers(header))) for header in compounds]
+
+#The render_file function renders the figures of a result file (one per compound)
+#to the output folder and returns a FigureSummary. The image files are named
+#after the result file (and the compound). Errors of the file are reported in
+#the summary instead of being raised
+def render_file(inputfile, outputdir, image_format='png', size=SIZE, dpi=DPI, delimiter=DELIMITER):
+
+    start=time.perf_counter()
+    name=result_name(inputfile)
+    outputfiles=[]
+    try:
+        template=figure_template(size, dpi)
+        for compound, inlet, outlet in read_results(inputfile, delimiter):
+            outputfile=name if compound is None else name+'_'+re.sub(r'[^\w.-]+', '_', compound).strip('_')
+            outputfile=os.path.join(outputdir, outputfile+'.'+image_format)
+            template.render(outputfile, inlet, outlet, title=name if compound is None else compound,
+                            ylabel='Concentration' if compound is None else compound)
+            outputfiles.append(outputfile)
+    except Exception as error:
+        #Whatever the error (e.g. a malformed line raising csv.Error), the other
+        #files go on
+        return FigureSummary(inputfile, outputfiles, time.perf_counter()-start, error_message(error))
+    return FigureSummary(inputfile, outputfiles, time.perf_counter()-start, None)
+
+#The result_name function returns the name of the image files of a result file
+#(the name of the file, or of the folder of .npy files, without extension)
+def result_name(inputfile):
+
+    return os.path.splitext(os.path.basename(os.path.normpath(inputfile)))[0]
+
+#The render_figures function renders the figures of many result files in
+#parallel with a pool of processes (one per CPU if processes is None) and
+#returns the FigureSummary of each file (in the order of inputs). If given, done
+#is called with each FigureSummary as soon as its file is done. Result files
+#with the same name as a former one (e.g. in another folder) are not rendered,
+#so that their figures do not overwrite each other
+def render_figures(inputs, outputdir, image_format='png', processes=None, size=SIZE, dpi=DPI,
+                   delimiter=DELIMITER, done=None):
+
+    if image_format not in FORMATS:
+        raise ValueError("Unknown format '%s' (choose from %s)" % (image_format, ', '.join(FORMATS)))
+    os.makedirs(outputdir, exist_ok=True)
+    summaries={}
+    tasks=[]
+    #Dictionary name of the images -> first result file with that name
+    names={}
+    for inputfile in inputs:
+        name=result_name(inputfile)
+        if name in names:
+            summaries[inputfile]=FigureSummary(inputfile, [], 0.0, "Same name as '%s'" % names[name])
+            if done is not None:
+                done(summaries[inputfile])
+            continue
+        names[name]=inputfile
+        tasks.append((inputfile, (outputdir, image_format, size, dpi, delimiter)))
+
+    def failed(inputfile, arguments, message):
+        return FigureSummary(inputfile, [], 0.0, message)
+
+    summaries.update(run_tasks(render_file, tasks, failed, processes, done))
+    return [summaries[inputfile] for inputfile in inputs if inputfile in summaries]
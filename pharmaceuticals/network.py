@@ -0,0 +1,220 @@
+"""
+/***************************************************************************
+ pharmaceuticals - network
+
+ Routing of the samples through a river network: a graph of reaches, each
+ with its own length, velocity, degradation rate coefficient k and flow,
+ joined at confluences where the flows mix.
+
+ The network is read from a csv file with one reach per line:
+
+ Reach;From;To;Length (m);Velocity (m/s);k (1/s);Flow (m3/s)
+ R1;Spring A;Confluence;1200;0.4;0.0001;2.5
+ R2;Spring B;Confluence;800;;0.0002;1.0
+ R3;Confluence;Outlet;3000;0.6;0.0001;3.5
+
+ where From and To are the upstream and downstream nodes of the reach. An empty
+ velocity means the average velocity measured at the inlet for each sample;
+ Velocity and Flow may be left out altogether (flows default to 1, i.e. equal
+ weights at confluences). Each node has at most one reach downstream (no
+ bifurcations) and the graph must have no loops.
+
+ Concentrations are given at the source nodes (nodes with no reach upstream)
+ for every sample of the input csv file. Reaches are visited in topological
+ order, each reach being one vectorized operation over all the samples:
+ travel time = length / velocity, concentration at the downstream node =
+ concentration at the upstream node * exp(-k * travel time). At a confluence
+ the concentrations of the reaches upstream are mixed weighted by their flows:
+ the arrival times of the reach with the largest flow are taken as the times
+ of the node, and the concentrations of the other reaches are interpolated at
+ those times.
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from collections import deque, namedtuple
+
+import numpy
+
+from pharmaceuticals.engine import arrival_times, as_timestamps, travel_times
+from pharmaceuticals.profiling import stage
+from pharmaceuticals.reader import DELIMITER, read_columns
+
+#Headers of the fields of the csv file of the network
+NETWORK_HEADERS=['Reach', 'From', 'To', 'Length (m)', 'Velocity (m/s)', 'k (1/s)', 'Flow (m3/s)']
+
+#The Reach tuple describes a reach of the network:
+#name       -> name of the reach
+#upstream   -> node at the upstream end of the reach
+#downstream -> node at the downstream end of the reach
+#length     -> length of the reach (m)
+#velocity   -> velocity of the water in the reach (m/s), or None for the
+#              average velocity measured at the inlet for each sample
+#k          -> degradation rate coefficient in the reach (1/s)
+#flow       -> flow of the reach (m3/s), the weight of the reach at confluences
+Reach=namedtuple('Reach', ['name', 'upstream', 'downstream', 'length', 'velocity', 'k', 'flow'])
+
+#The NetworkResult tuple holds the results of the routing through a network:
+#nodes        -> list of the names of the nodes (in topological order)
+#travel_time  -> travel time (s) from the sources to each node (nodes x samples array)
+#arrival_time -> date and time (datetime64) when each sample reaches each node (nodes x samples array)
+#conc         -> simulated concentrations at each node (nodes x samples array)
+NetworkResult=namedtuple('NetworkResult', ['nodes', 'travel_time', 'arrival_time', 'conc'])
+
+#The read_network function reads the reaches of a network from a csv file
+def read_network(path, delimiter=DELIMITER):
+
+    table=read_columns(path, delimiter=delimiter)
+    size=len(table)
+    velocities=table.raw(NETWORK_HEADERS[4]) if NETWORK_HEADERS[4] in table else ['']*size
+    flows=table.raw(NETWORK_HEADERS[6]) if NETWORK_HEADERS[6] in table else ['']*size
+    reaches=[]
+    for name, upstream, downstream, length, velocity, k, flow in zip(
+            table.raw(NETWORK_HEADERS[0]), table.raw(NETWORK_HEADERS[1]), table.raw(NETWORK_HEADERS[2]),
+            table.raw(NETWORK_HEADERS[3]), velocities, table.raw(NETWORK_HEADERS[5]), flows):
+        reaches.append(Reach(name, upstream, downstream, parse_number(name, 'length', length),
+                             parse_number(name, 'velocity', velocity) if velocity.strip() else None,
+                             parse_number(name, 'k', k),
+                             parse_number(name, 'flow', flow) if flow.strip() else 1.0))
+    return reaches
+
+#The parse_number function converts a property of a reach into a number
+def parse_number(reach, name, value):
+
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError("Invalid %s '%s' for reach '%s'" % (name, value, reach)) from None
+
+#The topological_order function returns the reaches sorted so that every reach
+#comes after all the reaches upstream of it (Kahn's algorithm)
+def topological_order(reaches):
+
+    downstream={}
+    inflows={}
+    for reach in reaches:
+        if reach.upstream in downstream:
+            raise ValueError("Node '%s' has more than one reach downstream ('%s' and '%s')"
+                             % (reach.upstream, downstream[reach.upstream].name, reach.name))
+        if reach.upstream==reach.downstream:
+            raise ValueError("Reach '%s' starts and ends at the same node" % reach.name)
+        downstream[reach.upstream]=reach
+        inflows.setdefault(reach.upstream, 0)
+        inflows[reach.downstream]=inflows.get(reach.downstream, 0)+1
+
+    #Starting from the sources, a reach is visited once all the reaches upstream
+    #of its upstream node have been visited
+    ready=deque(node for node, count in inflows.items() if count==0)
+    order=[]
+    while ready:
+        reach=downstream.get(ready.popleft())
+        if reach is None:
+            continue
+        order.append(reach)
+        inflows[reach.downstream]-=1
+        if inflows[reach.downstream]==0:
+            ready.append(reach.downstream)
+    if len(order)<len(reaches):
+        raise ValueError('The network has loops: %s' % ', '.join(
+            sorted(reach.name for reach in reaches if inflows[reach.upstream]>0)))
+    return order
+
+#The source_nodes function returns the nodes with no reach upstream (in the order of the reaches)
+def source_nodes(reaches):
+
+    ends=set(reach.downstream for reach in reaches)
+    return [reach.upstream for reach in reaches if reach.upstream not in ends]
+
+#The route_network function routes the samples through a network of reaches.
+#sources is a dictionary source node -> concentrations of the samples (arrays,
+#or numbers for constant concentrations), velocity holds the average velocities
+#measured at the inlet (used by the reaches with no velocity of their own) and
+#date_time the dates and times of measurement. The results are kept only for
+#the nodes in keep (all the nodes if None), so that large networks fit in memory
+def route_network(reaches, sources, velocity, date_time, keep=None):
+
+    reaches=topological_order(reaches)
+    date_time=as_timestamps(date_time)
+    velocity=numpy.asarray(velocity, dtype=numpy.float64)
+    samples=len(date_time)
+    #Dates and times of measurement as seconds since the first one (to compare
+    #arrival times through different branches)
+    start=date_time.astype('datetime64[us]')
+    seconds=(start-start[0]).astype(numpy.float64)/1e6 if samples else numpy.zeros(0)
+
+    #Dictionary node -> (travel time, concentration) of the nodes reached so far
+    #and not yet routed downstream, and list of the reaches arriving at each node
+    state={}
+    for node in source_nodes(reaches):
+        if node not in sources:
+            raise ValueError("No concentration given for the source node '%s'" % node)
+        conc=numpy.empty(samples, dtype=numpy.float64)
+        conc[:]=sources[node]
+        state[node]=(numpy.zeros(samples), conc)
+    arriving={}
+    for reach in reaches:
+        arriving.setdefault(reach.downstream, []).append(reach)
+    #The nodes at the end of the network (the outlets)
+    upstream=set(reach.upstream for reach in reaches)
+    outlets=[node for node in arriving if node not in upstream]
+
+    nodes=[]
+    results=[]
+    #Dictionary reach -> (travel time, concentration) at its downstream end
+    routed={}
+    with stage('route_network', samples):
+        for reach in reaches:
+            node=reach.upstream
+            if node not in state:
+                state[node]=mix([routed.pop(inflow)+(inflow.flow,) for inflow in arriving[node]], seconds)
+            travel_time, conc=state.pop(node)
+            if keep is None or node in keep:
+                nodes.append(node)
+                results.append((travel_time, conc))
+            #Routing the samples through the reach
+            reach_time=travel_times(velocity if reach.velocity is None else reach.velocity, reach.length)
+            routed[reach]=(travel_time+reach_time, conc*numpy.exp(-reach.k*reach_time))
+
+        for node in outlets:
+            travel_time, conc=mix([routed.pop(inflow)+(inflow.flow,) for inflow in arriving[node]], seconds)
+            if keep is None or node in keep:
+                nodes.append(node)
+                results.append((travel_time, conc))
+
+    travel_time=numpy.array([result[0] for result in results]).reshape(len(results), samples)
+    return NetworkResult(nodes, travel_time, arrival_times(date_time, travel_time),
+                         numpy.array([result[1] for result in results]).reshape(len(results), samples))
+
+#The mix function returns travel times and concentrations at a node, given the
+#(travel time, concentration, flow) of each reach arriving at the node and the
+#times of measurement (s). A single reach is passed on as it is; at a confluence
+#the times of the reach with the largest flow are kept and the concentrations of
+#the other reaches are interpolated at those times, then weighted by flow
+def mix(inflows, seconds):
+
+    if len(inflows)==1:
+        return inflows[0][:2]
+    main=max(range(len(inflows)), key=lambda i: inflows[i][2])
+    travel_time=inflows[main][0]
+    times=seconds+travel_time
+    total=sum(inflow[2] for inflow in inflows)
+    conc=numpy.zeros(len(times))
+    for inflow_time, inflow_conc, flow in inflows:
+        if inflow_time is not travel_time:
+            #Arrival times through the other reach, sorted for the interpolation
+            inflow_times=seconds+inflow_time
+            if (numpy.diff(inflow_times)<0).any():
+                order=numpy.argsort(inflow_times, kind='stable')
+                inflow_times, inflow_conc=inflow_times[order], inflow_conc[order]
+            inflow_conc=numpy.interp(times, inflow_times, inflow_conc)
+        conc+=inflow_conc*(flow/total)
+    return travel_time, conc
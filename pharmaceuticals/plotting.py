@@ -0,0 +1,214 @@
+"""
+/***************************************************************************
+ pharmaceuticals - plotting
+
+ Plotting of long series of concentrations that stays responsive at any
+ data size. Only the points of the series inside the current view are drawn,
+ downsampled to a few points per pixel keeping the minimum and maximum of
+ each bucket (so that peaks are never lost), and only a limited number of
+ labels of the visible points are annotated. Everything is updated each time
+ the view is zoomed or panned.
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import numpy
+
+from matplotlib import dates
+
+from pharmaceuticals.profiling import stage
+
+#Default number of buckets of the downsampled series (each bucket gives up to
+#two points, its minimum and its maximum)
+MAX_BUCKETS=1000
+
+#Default maximum number of labels annotated at the same time
+MAX_LABELS=50
+
+#The minmax_indices function returns the (sorted) indices of the points of y to
+#draw: y is split into n_buckets consecutive buckets and the minimum and the
+#maximum of each bucket are kept, together with the first and the last point.
+#Series with no more than 2*n_buckets points are kept whole
+def minmax_indices(y, n_buckets=MAX_BUCKETS):
+
+    y=numpy.asarray(y, dtype=numpy.float64)
+    if len(y)<=2*n_buckets:
+        return numpy.arange(len(y))
+
+    #Padding y so that it can be reshaped into a buckets x size matrix (missing
+    #values are never chosen as minimum or maximum)
+    size=-(-len(y)//n_buckets)
+    padded=numpy.full(n_buckets*size, numpy.nan)
+    padded[:len(y)]=y
+    padded=padded.reshape(n_buckets, size)
+    offsets=numpy.arange(n_buckets)*size
+    lowest=numpy.argmin(numpy.where(numpy.isnan(padded), numpy.inf, padded), axis=1)+offsets
+    highest=numpy.argmax(numpy.where(numpy.isnan(padded), -numpy.inf, padded), axis=1)+offsets
+
+    indices=numpy.unique(numpy.concatenate(([0, len(y)-1], lowest, highest)))
+    return indices[indices<len(y)]
+
+#The spread_indices function returns at most count indices evenly spread among
+#the given ones
+def spread_indices(indices, count):
+
+    if len(indices)<=count:
+        return indices
+    return indices[numpy.linspace(0, len(indices)-1, count).round().astype(numpy.intp)]
+
+#The ResponsiveSeries class draws a series of concentrations vs date and time on
+#matplotlib axes as a line (and, optionally, as points) and keeps it downsampled
+#to the current view; labels (e.g. sample IDs) are annotated with a suffix only
+#for up to max_labels points visible in the current view
+class ResponsiveSeries(object):
+
+    def __init__(self, axes, date_time, conc, labels=None, suffix='', points=True,
+                 max_buckets=MAX_BUCKETS, max_labels=MAX_LABELS, **line_options):
+
+        self.axes=axes
+        self.x=dates.date2num(numpy.asarray(date_time))
+        self.y=numpy.asarray(conc, dtype=numpy.float64)
+        #Arrays holding x and y (and room for the points added by extend)
+        self.xbuffer, self.ybuffer=self.x, self.y
+        self.labels=None if labels is None else numpy.asarray(labels, dtype=str)
+        self.suffix=suffix
+        self.max_buckets=max_buckets
+        self.max_labels=max_labels
+        self.annotations=[]
+        #Whether x is in order, so that the view is found by bisection
+        self.ordered=not (numpy.diff(self.x)<0).any()
+        #x limits of the view for which the points drawn (indices) were chosen
+        self.xlim=None
+
+        #Dates are drawn as numbers (days), so the x axis must know they are dates
+        axes.xaxis_date()
+
+        #The whole series is drawn downsampled at first, so that the axes are
+        #autoscaled to the whole data (minimum and maximum of each bucket are kept)
+        self.indices=minmax_indices(self.y, max_buckets)
+        self.line,=axes.plot(self.x[self.indices], self.y[self.indices], zorder=2, **line_options)
+        self.points=None
+        if points:
+            self.points=axes.scatter(self.x[self.indices], self.y[self.indices], zorder=1)
+        self.annotate(self.indices)
+
+        #Drawing again the series each time the view changes (the callbacks hold
+        #the series, so that it lives as long as the axes)
+        axes.callbacks.connect('xlim_changed', lambda axes: self.view_changed())
+        axes.callbacks.connect('ylim_changed', lambda axes: self.view_changed())
+
+    #The view_changed method is called by the axes when their x or y limits change:
+    #the points drawn are chosen again only if the x limits changed, while a change
+    #of the y limits (e.g. the second half of a zoom) only moves the labels
+    def view_changed(self):
+
+        if self.axes.get_xlim()!=self.xlim:
+            self.update()
+        else:
+            self.annotate(self.indices)
+
+    #The update method draws the points of the series inside the current view
+    def update(self):
+
+        self.xlim=self.axes.get_xlim()
+        xmin, xmax=sorted(self.xlim)
+        if self.ordered:
+            #The points inside the view are a slice of the series
+            start, stop=numpy.searchsorted(self.x, xmin, 'left'), numpy.searchsorted(self.x, xmax, 'right')
+            #The neighbours of the view are kept, so that the line reaches its borders
+            if start<stop:
+                start, stop=max(start-1, 0), min(stop+1, len(self.x))
+            with stage('plot', stop-start):
+                self.indices=start+minmax_indices(self.y[start:stop], self.max_buckets)
+                self.draw()
+            return
+        visible=numpy.flatnonzero((self.x>=xmin)&(self.x<=xmax))
+        #The neighbours of the view are kept (visible is sorted, so they are not in it)
+        if len(visible):
+            before=[visible[0]-1] if visible[0]>0 else []
+            after=[visible[-1]+1] if visible[-1]<len(self.x)-1 else []
+            visible=numpy.concatenate((before, visible, after)).astype(numpy.intp)
+        with stage('plot', len(visible)):
+            self.indices=visible[minmax_indices(self.y[visible], self.max_buckets)]
+            self.draw()
+
+    #The draw method sets the points of the line (and of the scatter) and the
+    #labels to the chosen indices
+    def draw(self):
+
+        self.line.set_data(self.x[self.indices], self.y[self.indices])
+        if self.points is not None:
+            self.points.set_offsets(numpy.column_stack((self.x[self.indices], self.y[self.indices])))
+        self.annotate(self.indices)
+
+    #The extend method appends new points to the series (e.g. the new samples of
+    #a live feed) and draws it again. The arrays grow by doubling their capacity,
+    #so that appending costs only as much as the new points. If the view reaches
+    #the end of the series, it is stretched to show the new points too
+    def extend(self, date_time, conc, labels=None):
+
+        x=dates.date2num(numpy.asarray(date_time))
+        y=numpy.asarray(conc, dtype=numpy.float64)
+        size=len(self.x)
+        if not len(x):
+            return
+        xmin, xmax=sorted(self.axes.get_xlim())
+        following=not size or xmax>=self.x[-1]
+
+        if size+len(x)>len(self.xbuffer):
+            capacity=max(2*len(self.xbuffer), size+len(x), 1024)
+            self.xbuffer=numpy.resize(self.xbuffer, capacity)
+            self.ybuffer=numpy.resize(self.ybuffer, capacity)
+        self.xbuffer[size:size+len(x)]=x
+        self.ybuffer[size:size+len(y)]=y
+        self.ordered=self.ordered and not (numpy.diff(x)<0).any() and not (size and x[0]<self.x[-1])
+        self.x=self.xbuffer[:size+len(x)]
+        self.y=self.ybuffer[:size+len(y)]
+        if self.labels is not None:
+            if isinstance(self.labels, numpy.ndarray):
+                self.labels=self.labels.tolist()
+            self.labels.extend(numpy.asarray(labels, dtype=str).tolist() if labels is not None else ['']*len(x))
+
+        if following:
+            #The first points of a series on axes which already hold other series
+            #stretch the view, so that the other series stay in it
+            shared=not size and any(len(line.get_xdata()) for line in self.axes.lines if line is not self.line)
+            if not size and not shared:
+                xmin, xmax=x.min(), x.min()
+                ymin, ymax=y.min(), y.min()
+            else:
+                ymin, ymax=sorted(self.axes.get_ylim())
+            #Margins beyond the new points, so that they are not on the borders of the view
+            xmargin=0.05*(x.max()-min(xmin, x.min())) or 1/24
+            ymargin=0.05*(max(ymax, y.max())-min(ymin, y.min())) or 1.0
+            if not size:
+                xmin=min(xmin, x.min()-xmargin) if shared else xmin-xmargin
+            self.axes.set_xlim(xmin, max(xmax, x.max()+xmargin), emit=False)
+            self.axes.set_ylim(min(ymin, y.min()-ymargin), max(ymax, y.max()+ymargin), emit=False)
+        self.update()
+
+    #The annotate method annotates the labels of (at most max_labels of) the
+    #given points which are inside the current view
+    def annotate(self, indices):
+
+        for annotation in self.annotations:
+            annotation.remove()
+        self.annotations=[]
+        if self.labels is None or not len(indices):
+            return
+
+        xmin, xmax=sorted(self.axes.get_xlim())
+        ymin, ymax=sorted(self.axes.get_ylim())
+        x, y=self.x[indices], self.y[indices]
+        inside=indices[(x>=xmin)&(x<=xmax)&(y>=ymin)&(y<=ymax)]
+        for i in spread_indices(inside, self.max_labels):
+            self.annotations.append(self.axes.annotate(self.labels[i]+self.suffix, (self.x[i], self.y[i])))
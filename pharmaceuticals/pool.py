@@ -0,0 +1,80 @@
+"""
+/***************************************************************************
+ pharmaceuticals - pool
+
+ Parallel processing of many files, one file per task, as done by the batch
+ and figures commands: the tasks are run by a pool of processes (or one after
+ the other, with a single process), the largest files first so that the pool
+ does not wait for a large file at the end, and each task which fails gives
+ an error message instead of stopping the others.
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+#The run_tasks function calls function(path, *arguments) for each task (path,
+#arguments) in parallel with a pool of processes (one per CPU if processes is
+#None), the largest files first, and returns the dictionary path -> result.
+#Unexpected errors of a task (e.g. a worker process killed) give the result
+#failed(path, arguments, message) and do not stop the other tasks. If given, done
+#is called with each result as soon as its task is done
+def run_tasks(function, tasks, failed, processes=None, done=None):
+
+    tasks=sorted(tasks, key=lambda task: path_size(task[0]), reverse=True)
+    results={}
+
+    if processes is None:
+        processes=os.cpu_count() or 1
+    processes=max(1, min(processes, len(tasks)))
+    if processes==1:
+        for path, arguments in tasks:
+            results[path]=function(path, *arguments)
+            if done is not None:
+                done(results[path])
+    elif tasks:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures=dict((pool.submit(function, path, *arguments), (path, arguments)) for path, arguments in tasks)
+            for future in as_completed(futures):
+                path, arguments=futures[future]
+                try:
+                    results[path]=future.result()
+                except Exception as error:
+                    results[path]=failed(path, arguments, error_message(error))
+                if done is not None:
+                    done(results[path])
+
+    return results
+
+#The error_message function returns the message of an error of a file as shown
+#in the summaries: the message alone for the errors expected of a file (missing
+#fields, invalid values, files which cannot be read), the type of the error too
+#for any other error (e.g. a malformed line raising csv.Error)
+def error_message(error):
+
+    if isinstance(error, KeyError):
+        return error.args[0]
+    if isinstance(error, (OSError, ValueError)):
+        return str(error)
+    return '%s: %s' % (type(error).__name__, error)
+
+#The path_size function returns the size of a file, or of all the files of a
+#folder (0 if it cannot be read)
+def path_size(path):
+
+    try:
+        if os.path.isdir(path):
+            return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        return os.path.getsize(path)
+    except OSError:
+        return 0
@@ -0,0 +1,218 @@
+"""
+/***************************************************************************
+ pharmaceuticals - profiling
+
+ Built-in instrumentation of the stages of the pipeline (reading the csv
+ file, converting its fields, simulating, writing the results, plotting).
+ For each stage the wall time, the number of rows processed, the rows per
+ second and the memory are recorded.
+
+ Profiling is off by default and costs next to nothing when off. It is turned
+ on by the --profile option of python -m pharmaceuticals, or by setting the
+ environment variable PHARMACEUTICALS_PROFILE (also for the Dialog) to:
+ -         -> one JSON line per stage is written to stderr as soon as the
+              stage is done (log lines)
+ file.json -> a JSON report of all the stages is written to file.json when
+              the program ends
+ Memory is given by the peak resident memory of the process; with --profile-memory
+ (or PHARMACEUTICALS_PROFILE_MEMORY=1) the memory allocated by each stage is
+ traced too, which slows down the run.
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+#The resource module (peak resident memory) is available only on Unix
+try:
+    import resource
+except ImportError:
+    resource=None
+
+#Environment variables turning profiling on
+PROFILE_VARIABLE='PHARMACEUTICALS_PROFILE'
+MEMORY_VARIABLE='PHARMACEUTICALS_PROFILE_MEMORY'
+
+#The NullStage class is the stage returned when profiling is off: it does nothing
+class NullStage(object):
+
+    rows=None
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exc_info):
+
+        return False
+
+NULL_STAGE=NullStage()
+
+#The Stage class measures a stage of the pipeline, as a context manager:
+#with stage('read') as record:
+#    ...
+#    record.rows=len(table)
+#Stages may be nested (the time of the inner stages is included in the outer one)
+class Stage(object):
+
+    def __init__(self, profiler, name, rows):
+
+        self.profiler=profiler
+        self.name=name
+        self.rows=rows
+        self.peak=0
+
+    def __enter__(self):
+
+        self.profiler._enter(self)
+        self.start=time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+
+        self.seconds=time.perf_counter()-self.start
+        self.profiler._exit(self, exc_info[0] is None)
+        return False
+
+#The Profiler class collects the measures of the stages and reports them
+#(as log lines or as a JSON report, depending on output)
+class Profiler(object):
+
+    def __init__(self, output='-', memory=False):
+
+        self.output=output
+        self.memory=memory
+        #Dictionary stage -> totals of all the runs of the stage
+        self.totals={}
+        self.lock=threading.Lock()
+        #Stages currently running, per thread (to trace the peak memory of nested stages)
+        self.local=threading.local()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stage(self, name, rows=None):
+
+        return Stage(self, name, rows)
+
+    def _stack(self):
+
+        if not hasattr(self.local, 'stack'):
+            self.local.stack=[]
+        return self.local.stack
+
+    def _enter(self, stage):
+
+        stack=self._stack()
+        if self.memory:
+            #The peak reached so far belongs to the outer stage, then the peak
+            #is reset to measure this stage alone
+            current, peak=tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1].peak=max(stack[-1].peak, peak-stack[-1].base)
+            tracemalloc.reset_peak()
+            stage.base=current
+        stack.append(stage)
+
+    def _exit(self, stage, succeeded):
+
+        stack=self._stack()
+        stack.pop()
+        record={'stage': stage.name, 'seconds': stage.seconds, 'rows': stage.rows,
+                'rows_per_second': stage.rows/stage.seconds if stage.rows is not None and stage.seconds>0 else None,
+                'max_rss_bytes': max_rss(), 'succeeded': succeeded}
+        if self.memory:
+            stage.peak=max(stage.peak, tracemalloc.get_traced_memory()[1]-stage.base)
+            record['allocated_bytes']=stage.peak
+            #The peak of this stage is also a peak of the outer stage
+            if stack:
+                stack[-1].peak=max(stack[-1].peak, stage.peak+stage.base-stack[-1].base)
+        with self.lock:
+            self.add(record)
+        if self.output=='-':
+            print(json.dumps(record), file=sys.stderr, flush=True)
+
+    #The add method adds the measures of a run of a stage to the totals of the stage
+    def add(self, record):
+
+        total=self.totals.setdefault(record['stage'], {'stage': record['stage'], 'calls': 0, 'seconds': 0.0,
+                                                       'rows': None, 'max_rss_bytes': 0})
+        total['calls']+=1
+        total['seconds']+=record['seconds']
+        if record['rows'] is not None:
+            total['rows']=(total['rows'] or 0)+record['rows']
+        total['rows_per_second']=total['rows']/total['seconds'] if total['rows'] is not None and total['seconds']>0 else None
+        total['max_rss_bytes']=max(total['max_rss_bytes'], record['max_rss_bytes'] or 0)
+        if 'allocated_bytes' in record:
+            total['allocated_bytes']=max(total.get('allocated_bytes', 0), record['allocated_bytes'])
+
+    #The report method returns the totals of all the stages, in the order they first ran
+    def report(self):
+
+        with self.lock:
+            return {'stages': [dict(total) for total in self.totals.values()], 'max_rss_bytes': max_rss()}
+
+    #The write method writes the JSON report to the output file (log lines
+    #are already written as the stages end)
+    def write(self):
+
+        if self.output!='-':
+            with open(self.output, 'w') as outputfile:
+                json.dump(self.report(), outputfile, indent=1)
+
+#The max_rss function returns the peak resident memory (bytes) of the process
+def max_rss():
+
+    if resource is None:
+        return None
+    #ru_maxrss is given in kilobytes on Linux and in bytes on macOS
+    scale=1 if sys.platform=='darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*scale
+
+#Profiler in use (None when profiling is off)
+_profiler=None
+
+#The stage function returns the context manager measuring a stage of the
+#pipeline; when profiling is off it returns NULL_STAGE, which does nothing
+def stage(name, rows=None):
+
+    if _profiler is None:
+        return NULL_STAGE
+    return _profiler.stage(name, rows)
+
+#The enable function turns profiling on (output is '-' for log lines on stderr
+#or the path of the JSON report, written when the program ends)
+def enable(output='-', memory=False):
+
+    global _profiler
+    disable()
+    _profiler=Profiler(output, memory)
+    atexit.register(_profiler.write)
+    return _profiler
+
+#The disable function turns profiling off and returns the profiler which was in use
+def disable():
+
+    global _profiler
+    profiler, _profiler=_profiler, None
+    if profiler is not None:
+        atexit.unregister(profiler.write)
+    return profiler
+
+#Profiling is turned on as soon as the package is imported if requested by the environment
+if os.environ.get(PROFILE_VARIABLE):
+    enable(os.environ[PROFILE_VARIABLE], os.environ.get(MEMORY_VARIABLE, '') not in ('', '0'))
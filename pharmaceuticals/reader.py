@@ -0,0 +1,262 @@
+"""
+/***************************************************************************
+ pharmaceuticals - reader
+
+ Single-pass columnar reader of the input csv file.
+ The whole file is read only once: the headers are taken from the first line
+ and every other line is split into columns which are kept in memory, so that
+ any field selected in the Dialog (or passed by a script) can be served
+ without reading the file again. Columns are converted on request into typed
+ numpy arrays (float64 for numbers, datetime64 for date and time, strings
+ for IDs) and the converted arrays are kept for later requests.
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+#Importing the csv module to manage csv files
+import csv
+import locale
+import os
+from itertools import islice
+
+#Importing the datetime class to parse date and time in arbitrary layouts
+from datetime import datetime
+
+#Importing numpy to store the fields of the csv file as typed arrays
+import numpy
+
+from pharmaceuticals.profiling import stage
+
+#Delimiter of the fields in the input csv file
+DELIMITER=';'
+
+#Encoding of the input csv files (the one of the platform, as for any text file
+#opened by Python); files read as bytes, as by pharmaceuticals.watch, are decoded
+#with it too
+ENCODING=locale.getpreferredencoding(False)
+
+#Format of date and time of measurement in the input csv file
+TIME_FORMAT='%Y-%m-%d %H:%M:%S'
+
+#The read_headers function allows to retrieve the headers of the fields of a
+#csv file reading only its first line
+def read_headers(path, delimiter=DELIMITER):
+
+    with open(path, newline='', encoding=ENCODING) as inputfile:
+        return next(csv.reader(inputfile, delimiter=delimiter), [])
+
+#The ColumnTable class holds the fields of a csv file in memory, one column
+#per header. Raw values are kept as strings and converted into typed numpy
+#arrays the first time they are requested through numbers, timestamps or strings
+class ColumnTable(object):
+
+    def __init__(self, headers, columns):
+
+        #List of the headers of the fields (in the same order of the csv file)
+        self.headers=list(headers)
+        #Dictionary header -> tuple of raw (string) values
+        self._raw=dict(zip(self.headers, columns))
+        #Dictionary (header, type) -> typed numpy array already converted
+        self._typed={}
+
+    def __len__(self):
+
+        for values in self._raw.values():
+            return len(values)
+        return 0
+
+    def __contains__(self, name):
+
+        return name in self._raw
+
+    #The raw method returns the values of a field as read from the csv file
+    def raw(self, name):
+
+        try:
+            return self._raw[name]
+        except KeyError:
+            raise KeyError("No field '%s' in the csv file" % name) from None
+
+    #The numbers method returns the values of a field as a float64 array
+    def numbers(self, name):
+
+        return self._convert(name, 'numbers', to_numbers)
+
+    #The timestamps method returns the values of a field as a datetime64 array
+    #(time_format is needed only for layouts other than YYYY-mm-dd hh:mm:ss)
+    def timestamps(self, name, time_format=TIME_FORMAT):
+
+        return self._convert(name, ('timestamps', time_format),
+                             lambda values: to_timestamps(values, time_format, name))
+
+    #The strings method returns the values of a field as an array of strings
+    def strings(self, name):
+
+        return self._convert(name, 'strings', to_strings)
+
+    def _convert(self, name, kind, function):
+
+        key=(name, kind)
+        if key not in self._typed:
+            values=self.raw(name)
+            with stage('convert:%s' % (kind if isinstance(kind, str) else kind[0]), len(values)):
+                self._typed[key]=function(values)
+        return self._typed[key]
+
+#The to_numbers function converts a sequence of strings into a float64 array
+def to_numbers(values):
+
+    return numpy.array(values, dtype=numpy.float64)
+
+#The to_timestamps function converts a sequence of strings of date and time
+#into a datetime64 array, parsing all the strings at once.
+#Strings in the fixed YYYY-mm-dd hh:mm:ss layout (the fast path) are parsed by
+#the datetime64 parser of numpy with a resolution of one second; if some strings
+#are longer (e.g. with fractions of a second) the resolution is taken from the
+#strings themselves, so that no precision is lost. Strings numpy cannot parse
+#(e.g. 2018-5-28 7:05:00, with no leading zeros) are parsed one by one, as are
+#strings in any other layout, which need their time_format (as in
+#datetime.strptime). Whole seconds are always given with a resolution of one
+#second, whatever the strings. Empty (or NaT) values are not valid dates and
+#times: they raise a ValueError naming the value and the field (name)
+def to_timestamps(values, time_format=TIME_FORMAT, name=None):
+
+    if isinstance(values, numpy.ndarray):
+        #Arrays of strings (or of bytes, as stored by pharmaceuticals.cache)
+        if time_format!=TIME_FORMAT:
+            values=values.astype(str)
+        lengths=set(numpy.unique(numpy.char.str_len(values)).tolist())
+    else:
+        lengths=set(map(len, values))
+    if time_format!=TIME_FORMAT:
+        return whole_seconds(numpy.array([parse_timestamp(value, time_format, name) for value in values],
+                                         dtype='datetime64[us]'))
+    try:
+        if lengths<={19}:
+            return numpy.array(values, dtype='datetime64[s]')
+        date_time=numpy.array(values, dtype='datetime64')
+    except ValueError:
+        date_time=None
+    if date_time is None or numpy.isnat(date_time).any():
+        #Parsed one by one, so that the invalid value is named
+        date_time=numpy.array([parse_timestamp(value, time_format, name) for value in values],
+                              dtype='datetime64[us]')
+    return whole_seconds(date_time)
+
+#The parse_timestamp function parses a single string of date and time, in the
+#time_format layout or (for the default layout) as an ISO 8601 date and time
+#with fractions of a second. Invalid values raise a ValueError naming the value
+#and the field (name)
+def parse_timestamp(value, time_format=TIME_FORMAT, name=None):
+
+    if isinstance(value, bytes):
+        value=value.decode()
+    try:
+        return datetime.strptime(value, time_format)
+    except ValueError:
+        pass
+    if time_format==TIME_FORMAT:
+        try:
+            date_time=numpy.datetime64(value.strip(), 'us')
+        except ValueError:
+            date_time=numpy.datetime64('NaT')
+        if not numpy.isnat(date_time):
+            return date_time
+    raise ValueError("Invalid date and time '%s'%s" % (value, " in field '%s'" % name if name else '')) from None
+
+#The whole_seconds function returns a datetime64 array with a resolution of one
+#second if all its values are whole seconds (or coarser), as it is otherwise
+def whole_seconds(date_time):
+
+    unit=numpy.datetime_data(date_time.dtype)[0]
+    if unit in ('Y', 'M', 'W', 'D', 'h', 'm', 's', 'generic'):
+        return date_time.astype('datetime64[s]')
+    if not (date_time.astype(numpy.int64)%(numpy.timedelta64(1, 's')//numpy.timedelta64(1, unit))).any():
+        return date_time.astype('datetime64[s]')
+    return date_time
+
+#The to_strings function converts a sequence of strings into a numpy array of strings
+def to_strings(values):
+
+    return numpy.array(values, dtype=str)
+
+#Number of lines read between two calls of the progress function of read_columns
+PROGRESS_LINES=65536
+
+#The read_columns function allows to read a whole csv file in a single pass and
+#returns a ColumnTable holding its fields. If given, progress is called from time
+#to time with the fraction (0-1) of the file already read
+def read_columns(path, delimiter=DELIMITER, progress=None):
+
+    with stage('read') as record, open(path, newline='', encoding=ENCODING) as inputfile:
+        lines=inputfile
+        if progress is not None:
+            lines=lines_with_progress(inputfile, os.fstat(inputfile.fileno()).st_size, progress)
+        csvReader=csv.reader(lines, delimiter=delimiter)
+        #The headers are given by the first line of the csv file
+        headers=next(csvReader, [])
+        #Reading all the other lines at once (empty lines are skipped)
+        rows=[row for row in csvReader if row]
+        record.rows=len(rows)
+        table=table_from_rows(headers, rows)
+
+    return table
+
+#The lines_with_progress function yields the lines of a file calling progress
+#every PROGRESS_LINES lines with the (approximate) fraction of the file read
+def lines_with_progress(inputfile, size, progress):
+
+    done=0
+    for number, line in enumerate(inputfile, 1):
+        done+=len(line)
+        if number%PROGRESS_LINES==0:
+            progress(min(1.0, done/max(size, 1)))
+        yield line
+
+#The read_chunks function allows to read a csv file of any size a piece at a time:
+#it yields a ColumnTable for each chunk of (at most) chunk_size lines, so that only
+#one chunk at a time is kept in memory
+def read_chunks(path, chunk_size, delimiter=DELIMITER):
+
+    if chunk_size<1:
+        raise ValueError('The size of the chunks must be at least one line')
+    with open(path, newline='', encoding=ENCODING) as inputfile:
+        csvReader=csv.reader(inputfile, delimiter=delimiter)
+        headers=next(csvReader, [])
+        while True:
+            with stage('read_chunk') as record:
+                lines=list(islice(csvReader, chunk_size))
+                #Empty lines are skipped
+                rows=[row for row in lines if row]
+                record.rows=len(rows)
+                table=table_from_rows(headers, rows) if rows else None
+            if not lines:
+                break
+            if table is not None:
+                yield table
+
+#The table_from_rows function transposes the rows of a csv file into a ColumnTable
+def table_from_rows(headers, rows):
+
+    #Rows shorter than the headers are completed with empty values and rows
+    #longer than the headers are cut, so that every column has the same length
+    width=len(headers)
+    if rows and set(map(len, rows))!={width}:
+        rows=[(row+['']*width)[:width] for row in rows]
+
+    #Transposing the rows into columns
+    if rows:
+        columns=list(zip(*rows))
+    else:
+        columns=[()]*width
+
+    return ColumnTable(headers, columns)
@@ -0,0 +1,82 @@
+"""
+/***************************************************************************
+ pharmaceuticals - streaming
+
+ Chunked processing of input csv files of any size (also larger than the
+ available memory): the input file is read a chunk of lines at a time, the
+ model is run on each chunk and the results are appended to the output file,
+ so that memory use depends only on the size of the chunks.
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import numpy
+
+from pharmaceuticals.engine import SimulationResult, arrival_times, decay, integrated_travel_times, simulate
+from pharmaceuticals.export import ResultWriter
+from pharmaceuticals.profiling import stage
+from pharmaceuticals.reader import DELIMITER, TIME_FORMAT, read_chunks
+
+#Default number of lines of the input csv file processed at a time
+CHUNK_SIZE=100000
+
+#The simulate_file function runs the model on an input csv file chunk by chunk
+#and writes the results to the output file (in one of the FORMATS of
+#pharmaceuticals.export) as soon as each chunk is done.
+#Each chunk calls update (if given) with its sample IDs, dates and times,
+#concentrations at the inlet and SimulationResult. It returns the number of
+#samples processed. With integrate=True travel times follow the velocities
+#measured during the transit (see pharmaceuticals.engine): the samples of a chunk
+#which have not reached the outlet by its last measurement are carried over to
+#the next chunk (the file must be in time order)
+def simulate_file(inputfile, outputfile, id_field, time_field, velocity_field, conc_field,
+                  distance, k, chunk_size=CHUNK_SIZE, time_format=TIME_FORMAT, delimiter=DELIMITER,
+                  update=None, output_format='csv', integrate=False):
+
+    samples=0
+    #Samples carried over (sample IDs, dates and times, concentrations and velocities)
+    pending=None
+    with stage('stream') as record, ResultWriter(outputfile, output_format, delimiter) as writer:
+        for table in read_chunks(inputfile, chunk_size, delimiter=delimiter):
+            columns=(table.strings(id_field), table.timestamps(time_field, time_format),
+                     table.numbers(conc_field), table.numbers(velocity_field))
+            if not integrate:
+                sample_id, date_time, inlet_conc, velocity=columns
+                result=simulate(inlet_conc, velocity, date_time, distance, k)
+            else:
+                if pending is not None:
+                    columns=[numpy.concatenate(values) for values in zip(pending, columns)]
+                sample_id, date_time, inlet_conc, velocity=columns
+                with stage('simulate', len(velocity)):
+                    travel_time=integrated_travel_times(velocity, date_time, distance, extrapolate=False)
+                    #Samples from the first one not arrived yet on are left to the next chunk
+                    waiting=numpy.flatnonzero(numpy.isnan(travel_time))
+                    end=waiting[0] if len(waiting) else len(travel_time)
+                    pending=[values[end:] for values in columns]
+                    sample_id, date_time, inlet_conc, velocity=[values[:end] for values in columns]
+                    travel_time=travel_time[:end]
+                    result=SimulationResult(travel_time, arrival_times(date_time, travel_time),
+                                            decay(inlet_conc, k, travel_time))
+            writer.write(sample_id, date_time, inlet_conc, result)
+            samples+=len(sample_id)
+            if update is not None:
+                update(sample_id, date_time, inlet_conc, result)
+        if pending is not None and len(pending[0]):
+            #The last samples keep the last velocity until they reach the outlet
+            sample_id, date_time, inlet_conc, velocity=pending
+            result=simulate(inlet_conc, velocity, date_time, distance, k, integrate=True)
+            writer.write(sample_id, date_time, inlet_conc, result)
+            samples+=len(sample_id)
+            if update is not None:
+                update(sample_id, date_time, inlet_conc, result)
+        record.rows=samples
+    return samples
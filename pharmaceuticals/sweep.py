@@ -0,0 +1,153 @@
+"""
+/***************************************************************************
+ pharmaceuticals - sweep
+
+ Parameter sweep of the model over a grid of degradation rate coefficients k
+ (1/s) and distances (m) for the same series of samples at the inlet.
+ The pairs (k, distance) of the grid are split into blocks shared among a
+ pool of processes (the series are sent only once to each process); within a
+ process, the scenarios of a block are computed by broadcasting scenarios x
+ samples arrays of at most BLOCK_ELEMENTS values.
+ The whole k x distance x samples cube is built only if asked for: the
+ summary statistics of the scenarios need no more than a block at a time.
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+from pharmaceuticals.engine import travel_times
+from pharmaceuticals.profiling import stage
+
+#The SweepResult tuple holds the results of a parameter sweep:
+#k, distance  -> values of the grid (1/s and m)
+#outlet_conc  -> k x distance x samples cube of simulated concentrations at the
+#                outlet (None if only the statistics were asked for)
+#mean, minimum, maximum, std -> k x distance summary statistics of each scenario
+SweepResult=namedtuple('SweepResult', ['k', 'distance', 'outlet_conc', 'mean', 'minimum', 'maximum', 'std'])
+
+#Maximum number of values computed at once by a process (scenarios x samples)
+BLOCK_ELEMENTS=2**22
+
+#The sweep_block function computes a block of scenarios, given as the pairs
+#(k_values[i], distances[i]), a sub-block at a time so that memory use stays
+#bounded: sub-blocks of scenarios and, for long series, of samples, whose
+#statistics are merged (as in Chan et al.'s parallel algorithm for the variance).
+#It returns the concentrations of the block (scenarios x samples, with the given
+#dtype; None if cube is False) and its statistics
+def sweep_block(inlet_conc, velocity, k_values, distances, dtype, cube=True):
+
+    inlet_conc=numpy.asarray(inlet_conc, dtype=numpy.float64)
+    #Travel time (s) of each sample per metre
+    slowness=travel_times(velocity, 1.0)
+    samples=len(inlet_conc)
+    pairs=len(k_values)
+    outlet=numpy.empty((pairs, samples), dtype=dtype) if cube else None
+    stats=[numpy.empty(pairs) for _ in range(4)]
+    sample_step=max(1, min(samples, BLOCK_ELEMENTS))
+    step=max(1, BLOCK_ELEMENTS//sample_step)
+    for start in range(0, pairs, step):
+        k=numpy.asarray(k_values[start:start+step], dtype=numpy.float64)[:, numpy.newaxis]
+        distance=numpy.asarray(distances[start:start+step], dtype=numpy.float64)[:, numpy.newaxis]
+        merged=None
+        for first in range(0, samples, sample_step):
+            outlet_conc=inlet_conc[first:first+sample_step]*numpy.exp(-k*(slowness[first:first+sample_step]*distance))
+            if cube:
+                outlet[start:start+step, first:first+sample_step]=outlet_conc
+            part=[numpy.mean(outlet_conc, axis=1), numpy.min(outlet_conc, axis=1),
+                  numpy.max(outlet_conc, axis=1), numpy.std(outlet_conc, axis=1), outlet_conc.shape[1]]
+            merged=part if merged is None else merge_stats(merged, part)
+        if merged is None:
+            #No samples at all
+            merged=[numpy.full(len(k), numpy.nan)]*4
+        for statistic, values in zip(stats, merged):
+            statistic[start:start+step]=values
+    return outlet, stats
+
+#The merge_stats function merges the statistics [mean, minimum, maximum, std,
+#count] of two sets of samples of the same scenarios
+def merge_stats(first, second):
+
+    mean1, minimum1, maximum1, std1, count1=first
+    mean2, minimum2, maximum2, std2, count2=second
+    count=count1+count2
+    delta=mean2-mean1
+    squares=std1**2*count1+std2**2*count2+delta**2*count1*count2/count
+    return [mean1+delta*count2/count, numpy.minimum(minimum1, minimum2), numpy.maximum(maximum1, maximum2),
+            numpy.sqrt(squares/count), count]
+
+#Series and pairs of the sweep of a worker process, set once per process by
+#share_series (so that they are not sent again with each block)
+SERIES={}
+
+#The share_series function keeps the inputs of a sweep in a worker process
+def share_series(inlet_conc, velocity, pair_k, pair_distance, dtype, cube):
+
+    SERIES.update(inlet_conc=inlet_conc, velocity=velocity, k=pair_k, distance=pair_distance, dtype=dtype, cube=cube)
+
+#The sweep_pairs function computes (as sweep_block) the block of the pairs from
+#start to stop of the sweep of a worker process
+def sweep_pairs(start, stop):
+
+    return sweep_block(SERIES['inlet_conc'], SERIES['velocity'], SERIES['k'][start:stop],
+                       SERIES['distance'][start:stop], SERIES['dtype'], SERIES['cube'])
+
+#The sweep function computes the concentrations at the outlet for every pair of
+#the grid k_values x distances. The pairs are split into blocks computed in
+#parallel by processes worker processes (one per CPU by default; 1 means no pool
+#at all), so that both k values and distances are shared among the processes.
+#The cube is stored as float32 by default to keep it compact, while summary
+#statistics are always computed in float64. With cube=False only the statistics
+#are computed and the cube is never built
+def sweep(inlet_conc, velocity, k_values, distances, processes=None, dtype=numpy.float32, cube=True):
+
+    k_values=numpy.asarray(k_values, dtype=numpy.float64).ravel()
+    distances=numpy.asarray(distances, dtype=numpy.float64).ravel()
+    shape=(len(k_values), len(distances))
+    #k and distance of each pair of the grid (k x distance order)
+    pair_k=numpy.repeat(k_values, len(distances))
+    pair_distance=numpy.tile(distances, len(k_values))
+    if processes is None:
+        processes=os.cpu_count() or 1
+    processes=max(1, min(processes, len(pair_k)))
+
+    with stage('sweep', len(inlet_conc)):
+        if processes==1:
+            outlet_conc, stats=sweep_block(inlet_conc, velocity, pair_k, pair_distance, dtype, cube)
+        else:
+            #A few blocks per process, so that the pool stays busy until the end;
+            #the series are sent once to each process, and each task gets only the
+            #bounds of its block of pairs
+            bounds=numpy.linspace(0, len(pair_k), min(processes*4, len(pair_k))+1).astype(numpy.int64).tolist()
+            with ProcessPoolExecutor(max_workers=processes, initializer=share_series,
+                                     initargs=(inlet_conc, velocity, pair_k, pair_distance, dtype, cube)) as pool:
+                results=list(pool.map(sweep_pairs, bounds[:-1], bounds[1:]))
+            outlet_conc=numpy.concatenate([result[0] for result in results]) if cube else None
+            stats=[numpy.concatenate([result[1][i] for result in results]) for i in range(4)]
+
+    if cube:
+        outlet_conc=outlet_conc.reshape(shape+(len(inlet_conc),))
+    return SweepResult(k_values, distances, outlet_conc, *[statistic.reshape(shape) for statistic in stats])
+
+#The parse_grid function converts a grid given as text into an array of values:
+#either a comma-separated list (e.g. 0.0001,0.0002) or START:STOP:NUM for NUM
+#evenly spaced values from START to STOP (both included)
+def parse_grid(text):
+
+    if ':' in text:
+        start, stop, number=text.split(':')
+        return numpy.linspace(float(start), float(stop), int(number))
+    return numpy.array([float(value) for value in text.split(',')])
@@ -0,0 +1,198 @@
+"""
+/***************************************************************************
+ pharmaceuticals - watch
+
+ Incremental processing of input csv files fed live (e.g. by autosamplers
+ appending a row every few minutes): the file is followed as it grows, only
+ the lines appended since the last update are read and simulated, and the
+ results are appended to the output csv file (and, if requested, to a plot
+ updated live). The cost of each update depends only on the new lines, not
+ on the length of the file.
+
+ python -m pharmaceuticals watch input.csv --conc-field "Diclofenac (ng/l)"
+                                 --distance 1000 --k 0.0001 --output out.csv
+
+ The position reached in the input file is saved next to the output file
+ (out.csv.offset), so that a watch stopped and started again goes on from
+ where it stopped, together with the hash of the bytes before it: an input
+ file replaced or truncated meanwhile is read again from the top. Lines with
+ invalid values are reported and skipped, so that the watch goes on.
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import csv
+import hashlib
+import io
+import os
+import time
+
+from pharmaceuticals.engine import simulate
+from pharmaceuticals.export import OUTPUT_HEADERS, write_csv_rows
+from pharmaceuticals.reader import DELIMITER, ENCODING, TIME_FORMAT, table_from_rows
+
+#Default number of seconds between two checks of the input file
+INTERVAL=5.0
+
+#Maximum number of bytes of the input file read at a time (a file with many
+#lines not processed yet is read a block after the other)
+BLOCK_SIZE=2**26
+
+#Number of bytes before the position reached in the input file whose hash tells
+#whether the file is still the same (and not replaced or truncated)
+MARK_SIZE=4096
+
+#The FileFollower class reads a csv file a piece at a time as it grows: each call
+#of read returns a ColumnTable with only the lines appended since the last call.
+#A line is read only once it is complete (i.e. ended by a newline), so that lines
+#being written at the time of the call are left to the next call. The position
+#reached comes with a mark (the hash of the bytes before it): if the file is
+#truncated or replaced, so that the mark changes, it is read again from the top
+class FileFollower(object):
+
+    def __init__(self, path, delimiter=DELIMITER, offset=0, block_size=BLOCK_SIZE, mark=None):
+
+        self.path=path
+        self.delimiter=delimiter
+        self.block_size=block_size
+        #Position (bytes) of the first line not read yet, its mark (None if
+        #unknown) and headers of the fields
+        self.offset=offset
+        self.mark=mark
+        self.headers=None
+
+    def read(self):
+
+        with open(self.path, 'rb') as inputfile:
+            size=os.fstat(inputfile.fileno()).st_size
+            if size<self.offset or (self.mark is not None and position_mark(inputfile, self.offset)!=self.mark):
+                #The file has been truncated or replaced: starting again from the top
+                self.offset=0
+                self.headers=None
+            if self.headers is None:
+                self.headers=self.read_headers(inputfile)
+                if self.headers is None:
+                    return None
+                self.offset=max(self.offset, inputfile.tell())
+            inputfile.seek(self.offset)
+            data=inputfile.read(min(size-self.offset, self.block_size))
+
+            #Only complete lines are read
+            end=data.rfind(b'\n')+1
+            if not end:
+                self.mark=position_mark(inputfile, self.offset)
+                return None
+            self.offset+=end
+            self.mark=position_mark(inputfile, self.offset)
+        lines=io.StringIO(data[:end].decode(ENCODING), newline='')
+        rows=[row for row in csv.reader(lines, delimiter=self.delimiter) if row]
+        return table_from_rows(self.headers, rows) if rows else None
+
+    #The read_headers method reads the headers from the first line of the file
+    #(None if the first line is not complete yet)
+    def read_headers(self, inputfile):
+
+        inputfile.seek(0)
+        line=inputfile.readline()
+        if not line.endswith(b'\n'):
+            return None
+        return next(csv.reader([line.decode(ENCODING).rstrip('\r\n')], delimiter=self.delimiter), [])
+
+#The position_mark function returns the mark of a position of a file open in
+#binary mode: the hash of the MARK_SIZE bytes before it
+def position_mark(inputfile, offset):
+
+    start=max(0, offset-MARK_SIZE)
+    inputfile.seek(start)
+    return hashlib.blake2b(inputfile.read(offset-start), digest_size=16).hexdigest()
+
+#The simulate_table function runs the model on the lines of a ColumnTable and
+#returns the sample IDs, dates and times, concentrations at the inlet and
+#SimulationResult. Lines with invalid values (e.g. a malformed line) are left
+#out, calling skipped (if given) with the values of each line and the error
+def simulate_table(table, id_field, time_field, velocity_field, conc_field, distance, k,
+                   time_format=TIME_FORMAT, skipped=None):
+
+    try:
+        return simulate_columns(table, id_field, time_field, velocity_field, conc_field, distance, k, time_format)
+    except ValueError:
+        pass
+    #Looking for the invalid lines one at a time
+    rows=[]
+    for row in zip(*[table.raw(header) for header in table.headers]):
+        try:
+            simulate_columns(table_from_rows(table.headers, [list(row)]), id_field, time_field, velocity_field,
+                             conc_field, distance, k, time_format)
+            rows.append(list(row))
+        except ValueError as error:
+            if skipped is not None:
+                skipped(row, str(error))
+    return simulate_columns(table_from_rows(table.headers, rows), id_field, time_field, velocity_field,
+                            conc_field, distance, k, time_format)
+
+#The simulate_columns function runs the model on all the lines of a ColumnTable
+#(as simulate_table, raising a ValueError for invalid values)
+def simulate_columns(table, id_field, time_field, velocity_field, conc_field, distance, k, time_format=TIME_FORMAT):
+
+    sample_id=table.strings(id_field)
+    inlet_conc=table.numbers(conc_field)
+    date_time=table.timestamps(time_field, time_format)
+    result=simulate(inlet_conc, table.numbers(velocity_field), date_time, distance, k)
+    return sample_id, date_time, inlet_conc, result
+
+#The watch_file function follows an input csv file as it grows and appends the
+#results of each new piece to the output csv file. Each piece calls update (if
+#given) with the new sample IDs, dates and times, concentrations at the inlet and
+#SimulationResult. Lines with invalid values are skipped, calling skipped (if
+#given) with the values of each line and the error. The file is checked every
+#interval seconds (waiting through the sleep function, e.g. to keep a plot
+#alive), updates times in all (forever if None). It returns the number of
+#samples processed
+def watch_file(inputfile, outputfile, id_field, time_field, velocity_field, conc_field, distance, k,
+               interval=INTERVAL, updates=None, update=None, sleep=time.sleep,
+               time_format=TIME_FORMAT, delimiter=DELIMITER, skipped=None):
+
+    #Going on from where a former watch of the same files stopped (the offset file
+    #holds the position reached and its mark)
+    offsetfile=outputfile+'.offset'
+    offset=0
+    mark=None
+    if os.path.exists(outputfile) and os.path.exists(offsetfile):
+        with open(offsetfile) as saved:
+            values=saved.read().split()
+        offset=int(values[0]) if values else 0
+        mark=values[1] if len(values)>1 else None
+    follower=FileFollower(inputfile, delimiter, offset, mark=mark)
+
+    samples=0
+    done=0
+    with open(outputfile, 'a' if offset else 'w', newline='') as output:
+        if not offset:
+            csv.writer(output, delimiter=delimiter).writerow(OUTPUT_HEADERS)
+        while updates is None or done<updates:
+            #Reading all the new lines, a block at a time
+            for table in iter(follower.read, None):
+                sample_id, date_time, inlet_conc, result=simulate_table(table, id_field, time_field, velocity_field,
+                                                                        conc_field, distance, k, time_format, skipped)
+                write_csv_rows(output, sample_id, date_time, inlet_conc, result, delimiter)
+                output.flush()
+                #The position is saved once the results are in the output file
+                #(also past lines skipped, so that they are not read again)
+                with open(offsetfile, 'w') as saved:
+                    saved.write('%d %s' % (follower.offset, follower.mark))
+                samples+=len(sample_id)
+                if update is not None:
+                    update(sample_id, date_time, inlet_conc, result)
+            done+=1
+            if updates is None or done<updates:
+                sleep(interval)
+    return samples
@@ -0,0 +1,80 @@
+"""
+/***************************************************************************
+ pharmaceuticals - workers
+
+ Background jobs of the Dialog: reading the csv file, converting its fields
+ and running the simulation are done on worker threads (a QThreadPool), so
+ that the Dialog never freezes. Each job reports its progress and hands its
+ result back to the Dialog through Qt signals, and can be cancelled.
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from PyQt5 import QtCore
+
+#The Cancelled exception stops a job which has been cancelled (it is raised by
+#the progress function handed to the job)
+class Cancelled(Exception):
+    pass
+
+#The JobSignals class holds the signals of a job. It lives in the thread of the
+#Dialog, so that signals emitted by the worker thread are delivered to the Dialog
+#in its own thread:
+#progress  -> percentage of the job done
+#finished  -> result of the job
+#failed    -> error message of the job
+#cancelled -> emitted when the job stops because it has been cancelled
+class JobSignals(QtCore.QObject):
+
+    progress=QtCore.pyqtSignal(int)
+    finished=QtCore.pyqtSignal(object)
+    failed=QtCore.pyqtSignal(str)
+    cancelled=QtCore.pyqtSignal()
+
+#The Job class runs a function on a worker thread of a QThreadPool.
+#The function is called with a single argument, a progress function which takes
+#the fraction (0-1) of the job done and which raises Cancelled once the job has
+#been cancelled. A cancelled job never emits finished, even if its function
+#does not call progress and runs until the end
+class Job(QtCore.QRunnable):
+
+    def __init__(self, function):
+
+        super(Job, self).__init__()
+        self.function=function
+        self.signals=JobSignals()
+        self.is_cancelled=False
+
+    #The cancel method asks the job to stop (it can be called from any thread)
+    def cancel(self):
+
+        self.is_cancelled=True
+
+    #The progress method is handed to the function of the job
+    def progress(self, fraction):
+
+        if self.is_cancelled:
+            raise Cancelled()
+        self.signals.progress.emit(int(100*fraction))
+
+    def run(self):
+
+        try:
+            self.progress(0)
+            result=self.function(self.progress)
+            self.progress(1)
+        except Cancelled:
+            self.signals.cancelled.emit()
+        except Exception as error:
+            self.signals.failed.emit(str(error))
+        else:
+            self.signals.finished.emit(result)
@@ -21,16 +21,144 @@ Input needed -> a csv file with (at least) the following fields:
 
 Expected output -> a plot of the measured (and simulated) pharmaceutical's
                    concentration vs time of measurement (and time of arrival
-                   of the collected sample at the outlet)
-
-Installation requirements -> you need the pandas and matplotlib libraries
-                             for plotting. To install them, run the OSGEO4W
-                             Shell AS ADMINISTRATOR and run:
-                             python -m pip install pandas
+                   of the collected sample at the outlet); the results
+                   can be saved to a csv file or to a folder of .npy
+                   files, one per column (numpy.load)
+
+Installation requirements -> you need the matplotlib library for plotting
+                             (numpy, which is needed for the simulation, is
+                             installed together with matplotlib). To install
+                             it, run the OSGEO4W Shell AS ADMINISTRATOR and run:
                              python -m pip install matplotlib
 
 How to run the script -> run the batch file run_pharmaceuticals_v0.1.bat
 
+After editing the Dialog -> the pharmaceuticals_v0.1.ui file is precompiled
+                            for a faster startup: after editing it with
+                            QtDesigner, run (from the folder of this file):
+                            pyuic5 pharmaceuticals_v0.1.ui
+                              -o pharmaceuticals/dialog_ui.py
+                            and check the startup time with:
+                            python benchmarks/startup_time.py
+
+How to run without the Dialog -> from the folder of this file, run:
+                                 python -m pharmaceuticals run input.csv
+                                   --conc-field "Diclofenac (ng/l)"
+                                   --distance 1000 --k 0.0001
+                                   --output output.csv
+                                 (--format npy --output folder writes
+                                 one .npy file per column instead)
+                                 (--integrate-velocity follows the
+                                 velocities measured during the transit,
+                                 as Varying v in the Dialog)
+                                 or, for many compounds at once:
+                                 python -m pharmaceuticals compounds
+                                   input.csv --k-file k_values.csv
+                                   --distance 1000 --output output.csv
+                                 or, for a network of reaches:
+                                 python -m pharmaceuticals network
+                                   input.csv --network reaches.csv
+                                   --source "Spring A=Diclofenac (ng/l)"
+                                   --output output.csv
+                                 or, to estimate k from concentrations
+                                 measured at the outlet too:
+                                 python -m pharmaceuticals calibrate
+                                   --site input.csv outlet.csv 1000
+                                   --compound "Diclofenac (ng/l)"
+                                   --method huber
+                                 (in the Dialog: Fit k..., next to k)
+                                 or, for the csv files of many sites:
+                                 python -m pharmaceuticals batch folder
+                                   --sites sites.csv --output-dir out
+                                 (sites.csv gives distance, k and fields
+                                 of each site, see
+                                 pharmaceuticals/batch.py)
+                                 or, for a csv file fed live:
+                                 python -m pharmaceuticals watch input.csv
+                                   --conc-field "Diclofenac (ng/l)"
+                                   --distance 1000 --k 0.0001
+                                   --output output.csv --plot
+                                 (only the new lines are processed)
+                                 or, for the figures of many results
+                                 (png, svg or pdf, with no display):
+                                 python -m pharmaceuticals figures
+                                   out/*_outlet.csv --output-dir figures
+                                 or, for a grid of k values and
+                                 distances (a parameter sweep):
+                                 python -m pharmaceuticals sweep input.csv
+                                   --conc-field "Diclofenac (ng/l)"
+                                   --k 1e-5:1e-3:20 --distance 100,1000
+                                   --output sweep.csv
+                                 (values are comma-separated, or
+                                 START:STOP:NUM for NUM values from START
+                                 to STOP; sweep.csv gives k, distance and
+                                 mean, minimum, maximum and standard
+                                 deviation of the concentration at the
+                                 outlet of each pair; --cube cube.npy
+                                 also writes all the concentrations, a
+                                 k x distance x samples array)
+                                 or, with uncertain k, distance and
+                                 velocities (Monte Carlo simulation):
+                                 python -m pharmaceuticals uncertainty
+                                   input.csv
+                                   --conc-field "Diclofenac (ng/l)"
+                                   --k normal:1e-4:2e-5
+                                   --distance uniform:900:1100
+                                   --velocity-factor lognormal:0:0.1
+                                   --draws 10000 --percentiles 5,50,95
+                                   --output percentiles.csv
+                                 (each distribution is fixed:VALUE or a
+                                 number alone, normal:MEAN:SD,
+                                 lognormal:MU:SIGMA of the logarithm,
+                                 uniform:LOW:HIGH or
+                                 triangular:LOW:MODE:HIGH; the measured
+                                 velocities are multiplied by the
+                                 velocity factor; --draws sets of k,
+                                 distance and velocity factor are drawn
+                                 for all the samples, --seed N gives the
+                                 same draws again; percentiles.csv
+                                 gives sample ID, date and time and one
+                                 column "Percentile P of the
+                                 concentration at the outlet" for each
+                                 percentile P)
+                                 (k_values.csv lists one field of
+                                 concentration and its k per line;
+                                 reaches.csv lists one reach per line, see
+                                 pharmaceuticals/network.py;
+                                 only numpy is needed; run
+                                 python -m pharmaceuticals --help for
+                                 all the options)
+
+Cache of the csv files -> the Dialog (and the compounds, network, sweep
+                          and uncertainty commands, with --cache) keep
+                          each csv file read in an on-disk cache, so
+                          that reading the same file again needs no
+                          parsing. The cache is in
+                          ~/.cache/pharmaceuticals (or in the folder
+                          given by PHARMACEUTICALS_CACHE_DIR); an entry
+                          takes up to about twice the room of its csv
+                          file, and
+                          the least recently used entries are removed
+                          when the cache grows beyond 10 GB (or the
+                          size in bytes given by
+                          PHARMACEUTICALS_CACHE_SIZE). A csv file which
+                          changes gets a new entry; the folder of the
+                          cache can be removed at any time
+
+How to measure performance -> from the folder of this file, run:
+                              python benchmarks/pipeline.py
+                                --rows 1000,100000,1000000
+                                --compounds 1,10
+                              to time each stage (reading, conversion,
+                              simulation, writing, plotting) on synthetic
+                              files made by benchmarks/generate_input.py
+                              To see where the time of a run goes, set
+                              PHARMACEUTICALS_PROFILE=profile.json (also
+                              for the Dialog) or run python -m
+                              pharmaceuticals --profile profile.json ...
+                              for a JSON report of time, rows and memory
+                              of each stage
+
                               -------------------
         begin                : 2018-06-25
         version              : 0.1
@@ -53,41 +181,42 @@ How to run the script -> run the batch file run_pharmaceuticals_v0.1.bat
 #Importing the sys module to interact with the operating system
 import sys
 
-#Importing the csv module to manage csv files
-import csv
-
-#Importing the pandas module to plot results
-import pandas
-
-from PyQt5 import uic
 from PyQt5 import QtWidgets
 #Importing all the methods of the QFileDialog and QMessageBox classes
 from PyQt5.QtWidgets import QFileDialog, QMessageBox
+#Importing the QThreadPool class, which runs background jobs on worker threads
+from PyQt5.QtCore import QThreadPool
+
+#Importing the form of the Dialog (precompiled from the pharmaceuticals_v0.1.ui
+#file designed with QtDesigner by running: pyuic5 pharmaceuticals_v0.1.ui -o pharmaceuticals/dialog_ui.py)
+from pharmaceuticals.dialog_ui import Ui_Dialog
 
-#Importing the datetime module to manage date and time
-import datetime
-#Importing all the methods of the datetime and timedelta classes
-from datetime import datetime, timedelta
+#Importing the Job class, which runs a function as a background job
+from pharmaceuticals.workers import Job
 
-#Importing all the methods of the exp class
-from math import exp
+#The modules for reading csv files, simulating and plotting (with numpy and
+#matplotlib) are imported only when they are needed for the first time, so
+#that the Dialog shows up as soon as possible
 
-#Importing all the methods of the pyplot class for plotting (the following lines
-#are necessary in order not to have an error like: No module named 'tkinter' and
-#in order to make the pyplot.show() command works)
-import matplotlib
-matplotlib.rcParams['backend'] = "Qt4Agg"
-from matplotlib import pyplot
+#The importPyplot function imports the pyplot class for plotting and the dates
+#class to manage time along the x axis (the backend line is necessary in order
+#not to have an error like: No module named 'tkinter' and in order to make the
+#pyplot.show() command works; Qt5Agg is the backend of PyQt5, used by the Dialog)
+def importPyplot():
 
-#Importing all the methods of the dates class to manage time along the x axis
-from matplotlib import dates
+    import matplotlib
+    matplotlib.rcParams['backend'] = "Qt5Agg"
+    from matplotlib import pyplot
+    from matplotlib import dates
+    return pyplot, dates
 
-class MyWindow(QtWidgets.QDialog):
+class MyWindow(QtWidgets.QDialog, Ui_Dialog):
     def __init__(self):
 
-        #Showing the Dialog window (content of the pharmaceuticals_v0.1.ui file designed with QtDesigner)#
+        #Showing the Dialog window (content of the pharmaceuticals_v0.1.ui file designed with QtDesigner,
+        #precompiled into the Ui_Dialog class)#
         super(MyWindow, self).__init__()
-        uic.loadUi('pharmaceuticals_v0.1.ui', self)
+        self.setupUi(self)
         self.show()
 
         #When clicking the browse_button button, recall the method loadReadcsv
@@ -96,6 +225,71 @@ class MyWindow(QtWidgets.QDialog):
         #When clicking the run_button button, recall the method run
         self.run_button.clicked.connect(self.run)
 
+        #When clicking the calibrate_button button, recall the method calibrate
+        self.calibrate_button.clicked.connect(self.calibrate)
+
+        #Reading the csv input file, retrieving its fields and simulating are done
+        #by background jobs (see the startJob method below), so that the Dialog
+        #never freezes. jobs is a dictionary name -> job still running
+        self.jobs={}
+
+        #When clicking the stop_button button, recall the method stopJobs
+        self.stop_button.clicked.connect(self.stopJobs)
+
+        #Once the text in the ID_field combo box is changed,
+        #recall the retrieveIdData function
+        self.ID_field.currentIndexChanged.connect(self.retrieveIdData)
+        #Once the text in the time_field combo box is changed,
+        #recall the retrieveTimeData function
+        self.time_field.currentIndexChanged.connect(self.retrieveTimeData)
+        #Once the text in the conc_inlet combo box is changed,
+        #recall the retrieveTimeData function
+        self.conc_inlet.currentIndexChanged.connect(self.retrieveCinletData)
+        #Once the text in the v_field combo box is changed,
+        #recall the retrieveVelocityData function
+        self.v_field.currentIndexChanged.connect(self.retrieveVelocityData)
+
+    #The startJob method runs function on a worker thread (function is called with a
+    #progress function, see pharmaceuticals.workers.Job) and hands its result to finished
+    #in the thread of the Dialog. A job with the same name still running is cancelled,
+    #as its result would be stale
+    def startJob(self, name, function, finished):
+
+        self.cancelJob(name)
+        job=Job(function)
+
+        #The result of a job is used only if the job has not been replaced or cancelled meanwhile
+        def jobFinished(result):
+            if self.jobs.get(name) is job:
+                del self.jobs[name]
+                finished(result)
+
+        def jobFailed(message):
+            if self.jobs.get(name) is job:
+                del self.jobs[name]
+                QMessageBox.question(self,'Error!',message, QMessageBox.Ok)
+
+        #The progress_bar shows the progress of the jobs
+        job.signals.progress.connect(self.progress_bar.setValue)
+        job.signals.finished.connect(jobFinished)
+        job.signals.failed.connect(jobFailed)
+        self.jobs[name]=job
+        QThreadPool.globalInstance().start(job)
+
+    #The cancelJob method cancels the job with the given name, if it is still running
+    def cancelJob(self, name):
+
+        job=self.jobs.pop(name,None)
+        if job is not None:
+            job.cancel()
+
+    #The stopJobs method cancels all the jobs still running
+    def stopJobs(self):
+
+        for name in list(self.jobs):
+            self.cancelJob(name)
+        self.progress_bar.setValue(0)
+
     #The loadReadcsv method allows to look for the input csv file of pharmaceuticals' concentrations
     #and to retrieve the fields of date and time, measured pharmaceuticals' concentration at the inlet
     #and measured pharmaceuticals' concentration at the outlet
@@ -111,219 +305,151 @@ class MyWindow(QtWidgets.QDialog):
         #retrieve*Data functions below
         self.inputfile,res=QFileDialog.getOpenFileName(self,"Select input csv file", "", '*.csv')
 
-        #If I clicked Open (i.e., if res is True), then it does nothing, otherwise it prints an error message
+        #If I clicked Open (i.e., if res is True), then it goes on, otherwise it prints an error message
         if res:
             pass
         else:
             print("You didn't select any csv file!")
+            return
 
         #The path_bar fills with the whole path of the selected csv file
         #(setText is a method of the QLabel class which holds the label's text)
         self.path_bar.setText(self.inputfile)
 
-        #Opening the csv input file just selected
-        with open(self.inputfile) as inputfile:
-
-            #DictReader is a class of the csv method which reads a csv file and
-            #returns a dictionary whose keys are given by the headers of the fields
-            csvReader=csv.DictReader(inputfile,delimiter=';')
-
-            #Iterating over the rows of the inputfile (each row becomes
-            #a dictionary, where the keys are the headers of the fields)
-            for row in csvReader:
-                dictionary=dict(row)
-                #Extractiong the headers of each field in the csv input file
-                #(each header is a key of the dictionary)
-                headers=list(dictionary.keys())
-                #Inserting the string 'Select a field...' at the beginning of
-                #the list headers
-                headers.insert(0,'Select a field...')
-
-            #Filling the combo boxes ID_field, time_field, conc_inlet and v_field
-            #of the Dialog with headers of the csv input file (addItems is a method
-            #of the QComboBox class which provides a list of options in a combo box)
-            self.ID_field.addItems(headers)
-            self.time_field.addItems(headers)
-            self.conc_inlet.addItems(headers)
-            self.v_field.addItems(headers)
-
-            #Once the text in the ID_field combo box is changed,
-            #recall the retrieveIdData function
-            self.ID_field.currentIndexChanged.connect(self.retrieveIdData)
-            #Once the text in the time_field combo box is changed,
-            #recall the retrieveTimeData function
-            self.time_field.currentIndexChanged.connect(self.retrieveTimeData)
-            #Once the text in the conc_inlet combo box is changed,
-            #recall the retrieveTimeData function
-            self.conc_inlet.currentIndexChanged.connect(self.retrieveCinletData)
-            #Once the text in the v_field combo box is changed,
-            #recall the retrieveVelocityData function
-            self.v_field.currentIndexChanged.connect(self.retrieveVelocityData)
+        #Reading the whole csv input file just selected only once, by a background job
+        #(jobs still running on the previous csv file are cancelled).
+        #read_columns_cached returns a ColumnTable which holds all the fields
+        #of the csv input file (the headers are taken from its first line), so that
+        #the retrieve*Data methods below do not need to open the file again.
+        #Files read before are taken from the on-disk cache of the pharmaceuticals
+        #package, without parsing them again.
+        #When the file has been read, recall the showFields method
+        self.stopJobs()
+        inputfile=self.inputfile
+        def reading(progress):
+            from pharmaceuticals.cache import read_columns_cached
+            return read_columns_cached(inputfile,progress=progress)
+        self.startJob('load',reading,self.showFields)
+
+    #The showFields method fills the combo boxes with the headers of the csv input file
+    #once it has been read
+    def showFields(self, table):
+
+        self.table=table
+
+        #Extracting the headers of each field in the csv input file
+        headers=list(self.table.headers)
+        #Inserting the string 'Select a field...' at the beginning of
+        #the list headers
+        headers.insert(0,'Select a field...')
+
+        #Filling the combo boxes ID_field, time_field, conc_inlet and v_field
+        #of the Dialog with headers of the csv input file (addItems is a method
+        #of the QComboBox class which provides a list of options in a combo box).
+        #Headers of a csv file read before are removed (clear), and signals are
+        #blocked meanwhile so that no field is retrieved before being selected
+        for combo in (self.ID_field,self.time_field,self.conc_inlet,self.v_field):
+            combo.blockSignals(True)
+            combo.clear()
+            combo.addItems(headers)
+            combo.blockSignals(False)
 
     #The retrieveTimeData method allows to retrieve the values of samples IDs
-    #and to store such values in a list sample_id
+    #and to store such values in an array sample_id
     def retrieveIdData(self):
 
-        #Opening the csv input file
-        with open(self.inputfile) as inputfile:
-
-            #DictReader is a class of the csv method which reads a csv file and
-            #returns a dictionary whose keys are given by the header of the fields
-            csvReader=csv.DictReader(inputfile,delimiter=';')
-
-            #The following list will contain values of the sample ID field of
-            #the csv input file.
-            #I use self.sample_id (and not just sample_id) because I will
-            #need this variable in the run function below
+        #Reading the content of the combo box ID_field of the Dialog.
+        #This content will be assigned to the variable id_field, which will
+        #be a string (currentText is a method of the QComboBox class which
+        #holds the text displayed in a combo box)
+        id_field=self.ID_field.currentText()
+
+        #The following array will contain values of the sample ID field of
+        #the csv input file (as strings), taken from the fields already in memory.
+        #I use self.sample_id (and not just sample_id) because I will
+        #need this variable in the run function below
+        #The values are converted by a background job (a job still converting
+        #the field selected before is cancelled)
+        self.sample_id=[]
+        if id_field in self.table:
+            self.startJob('ID_field',lambda progress: self.table.strings(id_field),
+                          lambda values: setattr(self,'sample_id',values))
+        else:
+            print('Select a field for Sample ID')
             self.sample_id=[]
 
-            #Reading the content of the combo box ID_field of the Dialog.
-            #This content will be assigned to the variable id_field, which will
-            #be a string (currentText is a method of the QComboBox class which
-            #holds the text displayed in a combo box)
-            id_field=self.ID_field.currentText()
-
-            #Checking the content of the combo box ID_field of the Dialog
-            if id_field=='Select a field...':
-                print('Select a field for Sample ID')
-
-            #Iterating over the rows of the inputfile (each row becomes
-            #a dictionary, where the keys are the headers of the fields)
-            for row in csvReader:
-                dictionary=dict(row)
-                #Extractiong the headers of each field in the csv input file
-                #(each header is a key of the dictionary)
-                headers=list(dictionary.keys())
-                #Iterating over the headers list
-                for field_name in headers:
-                    #Filling the date_time list with values of date and time
-                    #found in each row of the csv input file
-                    if field_name==id_field:
-                        self.sample_id.append(dictionary[field_name])
-
     #The retrieveTimeData method allows to retrieve the values of date and time of samples
-    #and to store such values in a list date_time
+    #and to store such values in an array date_time
     def retrieveTimeData(self):
 
-        #Opening the csv input file
-        with open(self.inputfile) as inputfile:
-
-            #DictReader is a class of the csv method which reads a csv file and
-            #returns a dictionary whose keys are given by the header of the fields
-            csvReader=csv.DictReader(inputfile,delimiter=';')
-
-            #The following list will contain values of the time field of
-            #the csv input file.
-            #I use self.date_time (and not just date_time) because I will
-            #need this variable in the run function below
+        #Reading the content of the combo box time_field of the Dialog.
+        #This content will be assigned to the variable t_field, which will
+        #be a string (currentText is a method of the QComboBox class which
+        #holds the text displayed in a combo box)
+        t_field=self.time_field.currentText()
+
+        #The following array will contain values of the time field of
+        #the csv input file (as datetime64), taken from the fields already in memory.
+        #I use self.date_time (and not just date_time) because I will
+        #need this variable in the run function below
+        #The values are converted by a background job (a job still converting
+        #the field selected before is cancelled)
+        self.date_time=[]
+        if t_field in self.table:
+            self.startJob('time_field',lambda progress: self.table.timestamps(t_field),
+                          lambda values: setattr(self,'date_time',values))
+        else:
+            print('Select a field for Measurement time')
             self.date_time=[]
 
-            #Reading the content of the combo box time_field of the Dialog.
-            #This content will be assigned to the variable t_field, which will
-            #be a string (currentText is a method of the QComboBox class which
-            #holds the text displayed in a combo box)
-            t_field=self.time_field.currentText()
-
-            #Checking the content of the combo box time_field of the Dialog
-            if t_field=='Select a field...':
-                print('Select a field for Measurement time')
-
-            #Iterating over the rows of the inputfile (each row becomes
-            #a dictionary, where the keys are the headers of the fields)
-            for row in csvReader:
-                dictionary=dict(row)
-                #Extractiong the headers of each field in the csv input file
-                #(each header is a key of the dictionary)
-                headers=list(dictionary.keys())
-                #Iterating over the headers list
-                for field_name in headers:
-                    #Filling the date_time list with values of date and time
-                    #found in each row of the csv input file
-                    if field_name==t_field:
-                        self.date_time.append(dictionary[field_name])
-
     #The retrieveCinletData method allows to retrieve the values of pharmaceuticals' concentrations
-    #at the inlet and to store such values in a list inlet_conc
+    #at the inlet and to store such values in an array inlet_conc
     def retrieveCinletData(self):
 
-        #Opening the csv input file
-        with open(self.inputfile) as inputfile:
-
-            #DictReader is a class of the csv method which reads a csv file and
-            #returns a dictionary whose keys are given by the header of the fields
-            csvReader=csv.DictReader(inputfile,delimiter=';')
-
-            #The following list will contain values of the inlet concentration
-            #field of the csv input file.
-            #I use self.inlet_conc (and not just inlet_conc) because I will
-            #need this variable in the run function below
+        #Reading the content of the combo box conc_inlet of the Dialog.
+        #This content will be assigned to the variable cinlet_field, which will
+        #be a string (currentText is a method of the QComboBox class which
+        #holds the text displayed in a combo box)
+        cinlet_field=self.conc_inlet.currentText()
+
+        #The following array will contain values of the inlet concentration
+        #field of the csv input file (as float64), taken from the fields already in memory.
+        #I use self.inlet_conc (and not just inlet_conc) because I will
+        #need this variable in the run function below
+        #The values are converted by a background job (a job still converting
+        #the field selected before is cancelled)
+        self.inlet_conc=[]
+        if cinlet_field in self.table:
+            self.startJob('conc_inlet',lambda progress: self.table.numbers(cinlet_field),
+                          lambda values: setattr(self,'inlet_conc',values))
+        else:
+            print('Select a field for Concentration measured at the inlet')
             self.inlet_conc=[]
 
-            #Reading the content of the combo box conc_inlet of the Dialog.
-            #This content will be assigned to the variable cinlet_field, which will
-            #be a string (currentText is a method of the QComboBox class which
-            #holds the text displayed in a combo box)
-            cinlet_field=self.conc_inlet.currentText()
-
-            #Checking the content of the combo box conc_inlet of the Dialog
-            if cinlet_field=='Select a field...':
-                print('Select a field for Concentration measured at the inlet')
-
-            #Iterating over the rows of the inputfile (each row becomes
-            #a dictionary, where the keys are the headers of the fields)
-            for row in csvReader:
-                dictionary=dict(row)
-                #Extractiong the headers of each field in the csv input file
-                #(each header is a key of the dictionary)
-                headers=list(dictionary.keys())
-                #Iterating over the headers list
-                for field_name in headers:
-                    #Filling the inlet_conc list with values of concentration
-                    #at the inlet found in each row of the csv input file
-                    if field_name==cinlet_field:
-                        self.inlet_conc.append(dictionary[field_name])
-
     #The retrieveVelocityData method allows to retrieve the values of stream velocities
-    #at the inlet and to store such values in a list avg_velocity
+    #at the inlet and to store such values in an array avg_velocity
     def retrieveVelocityData(self):
 
-        #Opening the csv input file
-        with open(self.inputfile) as inputfile:
-
-            #DictReader is a class of the csv method which reads a csv file and
-            #returns a dictionary whose keys are given by the header of the fields
-            csvReader=csv.DictReader(inputfile,delimiter=';')
-
-            #The following list will contain values of the stream velocity
-            #field of the csv input file.
-            #I use self.avg_velocity (and not just avg_velocity) because I will
-            #need this variable in the run function below
+        #Reading the content of the combo box v_field of the Dialog.
+        #This content will be assigned to the variable velocity_field, which will
+        #be a string (currentText is a method of the QComboBox class which
+        #holds the text displayed in a combo box)
+        velocity_field=self.v_field.currentText()
+
+        #The following array will contain values of the stream velocity
+        #field of the csv input file (as float64), taken from the fields already in memory.
+        #I use self.avg_velocity (and not just avg_velocity) because I will
+        #need this variable in the run function below
+        #The values are converted by a background job (a job still converting
+        #the field selected before is cancelled)
+        self.avg_velocity=[]
+        if velocity_field in self.table:
+            self.startJob('v_field',lambda progress: self.table.numbers(velocity_field),
+                          lambda values: setattr(self,'avg_velocity',values))
+        else:
+            print('Select a field for Average velocity of the stream at the inlet')
             self.avg_velocity=[]
 
-            #Reading the content of the combo box v_field of the Dialog.
-            #This content will be assigned to the variable velocity_field, which will
-            #be a string (currentText is a method of the QComboBox class which
-            #holds the text displayed in a combo box)
-            velocity_field=self.v_field.currentText()
-
-            #Checking the content of the combo box v_field of the Dialog
-            if velocity_field=='Select a field...':
-                print('Select a field for Average velocity of the stream at the inlet')
-
-            #Iterating over the rows of the inputfile (each row becomes
-            #a dictionary, where the keys are the headers of the fields)
-            for row in csvReader:
-                dictionary=dict(row)
-                #Extractiong the headers of each field in the csv input file
-                #(each header is a key of the dictionary)
-                headers=list(dictionary.keys())
-                #Iterating over the headers list
-                for field_name in headers:
-                    #Filling the outlet_conc list with values of concentration
-                    #at the outlet found in each row of the csv input file
-                    if field_name==velocity_field:
-                        self.avg_velocity.append(dictionary[field_name])
-
     #The run method allows to simulate pharmaceuticals' concentration at the outlet, based on the
     #measured concentration at the inlet and on the travel time of the sample collected at the inlet until the outlet
     def run(self):
@@ -338,6 +464,7 @@ class MyWindow(QtWidgets.QDialog):
             #When clicking 'Ok', nothing appens (the Dialog remains open)
             if check1==QMessageBox.Ok:
                 pass
+            return
 
         #Checking the content of the combo box time_field of the Dialog
         if self.time_field.currentText()=='Select a field...':
@@ -349,6 +476,7 @@ class MyWindow(QtWidgets.QDialog):
             #When clicking 'Ok', nothing appens (the Dialog remains open)
             if check2==QMessageBox.Ok:
                 pass
+            return
 
         #Checking the content of the combo box conc_inlet of the Dialog
         if self.conc_inlet.currentText()=='Select a field...':
@@ -360,6 +488,7 @@ class MyWindow(QtWidgets.QDialog):
             #When clicking 'Ok', nothing appens (the Dialog remains open)
             if check3==QMessageBox.Ok:
                 pass
+            return
 
         #Checking the content of the combo box v_field of the Dialog
         if self.v_field.currentText()=='Select a field...':
@@ -371,152 +500,199 @@ class MyWindow(QtWidgets.QDialog):
             #When clicking 'Ok', nothing appens (the Dialog remains open)
             if check4==QMessageBox.Ok:
                 pass
+            return
 
         #Reading the content of the distance line edit.
         #(text is a method of the QtWidgets class which
         #holds the content of a line edit)
         d=self.distance.text()
 
-        #Calculating the time shift (when sample collected at the inlet reaches the outlet).
-        #This depends on the average velocity of the stream measured at the inlet (list avg_velocity)
-        #and on the distance covered (value input into the distance line edit, i.e., d variable)
-
-        #time_shift is a list containing the calculus of
-        #time shift for each sample at the inlet
-        time_shift=[]
-        #Iterating over the list avg_velocity
-        for v in self.avg_velocity:
-            #Updating the list time_shift (recall that d and the
-            #elements of the list avg_velocity are strings!).
-            #As d is expressed in m and v is expressed in m/s,
-            #then time_shift values will be expressed in seconds
-            time_shift.append(float(d)/float(v))
-        #date_time_shifted is a new list containing times from the list date_time
-        #shifted by the amounts contained in the list time_shift.
-        date_time_shifted=[]
-        #Iterating over the list date_time
-        for t in self.date_time:
-            #Updating the list date_time_shifted (strptime is a method of the
-            #datetime class which allows to convert a string in a datetime object).
-            #By now, date_time_shifted is nothing but a copy of date_time, but its
-            #elements are not strings (as in date_time) but datetime objects
-            date_time_shifted.append(datetime.strptime(t,'%Y-%m-%d %H:%M:%S'))
-        #Iterating over the length of the list time_shift
-        for i in range(len(time_shift)):
-            #Updating the list date_time_shifted (timedelta is a method of the
-            #datetime class which allows to add some time to the original list date_time).
-            #After the shift of the original list date_time, elements of the list
-            #date_time_shifted are converted into strings.
-            #(Each element of the date_time_shifted list has a format like
-            #2000-01-01 00:00:00.00000 (with milliseconds). The split method allows to cut
-            #what is after the point, i.e., allows to cut milliseconds. This is necessary
-            #for plotting results
-            date_time_shifted[i]=str(date_time_shifted[i]+timedelta(seconds=time_shift[i])).split(".")[0]
-
         #Reading the content of the degradation line edit.
         #(text is a method of the QtWidgets class which
         #holds the content of a line edit)
         k=self.degradation.text()
 
-        #sim_conc is the list of simulated pharmaceuticals' concentration at the outlet
-        sim_conc=[]
-        #Iterating over the length of the list inlet_conc
-        for i in range(len(self.inlet_conc)):
-            #Calculating the simulated concentration at the outlet as
-            #C_oulet = C_inlet * exp[-(k*t)],
-            #where: C_inlet is the measured pharmaceuticals' concentration at the outlet (list inlet_conc)
-            #       k is the degradation rate coefficient for pharmaceutical (1/s)
-            #       t is the time instant (s) when the sample collected at the inlet reaches the outlet
-            #       (the stating time istant is t=0, so actually t is a DeltaT; list time_shift)
-            sim_conc.append(float(self.inlet_conc[i])*exp(-(float(k)*time_shift[i])))
+        #Names of the fields selected in the combo boxes
+        id_field=self.ID_field.currentText()
+        t_field=self.time_field.currentText()
+        cinlet_field=self.conc_inlet.currentText()
+        velocity_field=self.v_field.currentText()
+        table=self.table
+
+        #With the Varying v check box checked, the travel time of each sample follows the
+        #velocities measured during its transit (integrated over time) instead of its own
+        integrate=self.integrate_velocity.isChecked()
+
+        #The simulation function is run by a background job: it takes the fields
+        #of the csv input file (already in memory) and simulates pharmaceuticals'
+        #concentration at the outlet (simulate is a function of the
+        #pharmaceuticals.engine module which works on whole arrays).
+        #The time shift (when sample collected at the inlet reaches the outlet)
+        #depends on the average velocity of the stream measured at the inlet (array
+        #avg_velocity) and on the distance covered (d variable). As d is expressed
+        #in m and velocities are expressed in m/s, time shifts are expressed in seconds.
+        #The simulated concentration at the outlet is calculated as
+        #C_oulet = C_inlet * exp[-(k*t)],
+        #where: C_inlet is the measured pharmaceuticals' concentration at the inlet (array inlet_conc)
+        #       k is the degradation rate coefficient for pharmaceutical (1/s)
+        #       t is the time instant (s) when the sample collected at the inlet reaches the outlet
+        #       (the stating time istant is t=0, so actually t is a DeltaT; array time_shift)
+        def simulation(progress):
+            from pharmaceuticals.engine import simulate
+            sample_id=table.strings(id_field)
+            date_time=table.timestamps(t_field)
+            inlet_conc=table.numbers(cinlet_field)
+            avg_velocity=table.numbers(velocity_field)
+            progress(0.5)
+            result=simulate(inlet_conc,avg_velocity,date_time,float(d),float(k),integrate=integrate)
+            return sample_id,date_time,inlet_conc,avg_velocity,result
+
+        #When the simulation is done, recall the plotResults method
+        self.startJob('run',simulation,self.plotResults)
+
+    #The calibrate method allows to estimate the degradation rate coefficient k from the
+    #pharmaceuticals' concentrations measured at the outlet too, and writes it in the
+    #degradation line edit. The csv file of the outlet must have the same fields of
+    #measurement time and concentration selected for the inlet
+    def calibrate(self):
+
+        #Checking the content of the combo boxes needed to compute the arrival times
+        for combo,name in ((self.time_field,'Measurement time'),
+                           (self.conc_inlet,'Concentration measured at the inlet'),
+                           (self.v_field,'Average velocity of the stream at the inlet')):
+            if combo.currentText()=='Select a field...':
+                QMessageBox.question(self,'Error!',"Select a field for "+name, QMessageBox.Ok)
+                return
+
+        #Selecting the csv file of the concentrations measured at the outlet
+        outletfile,res=QFileDialog.getOpenFileName(self,"Select csv file of the outlet", "", '*.csv')
+        if not res:
+            print("You didn't select any csv file!")
+            return
+
+        #Reading the content of the distance line edit
+        d=self.distance.text()
+
+        #Names of the fields selected in the combo boxes
+        t_field=self.time_field.currentText()
+        cinlet_field=self.conc_inlet.currentText()
+        velocity_field=self.v_field.currentText()
+        table=self.table
+
+        #The fitting function is run by a background job: each sample measured at
+        #the outlet is matched to the sample of the inlet arriving closest in time
+        #and k is estimated by a robust fit of ln(C_inlet/C_outlet)=k*t
+        #(calibrate is a function of the pharmaceuticals.calibration module)
+        def fitting(progress):
+            from pharmaceuticals.calibration import calibrate
+            from pharmaceuticals.reader import read_columns
+            outlet=read_columns(outletfile)
+            progress(0.5)
+            compounds,result=calibrate({cinlet_field: table.numbers(cinlet_field)},
+                                       {cinlet_field: outlet.numbers(cinlet_field)},
+                                       table.numbers(velocity_field),table.timestamps(t_field),
+                                       outlet.timestamps(t_field),float(d),method='huber')
+            if not result.pairs[0]:
+                raise ValueError('No sample of the outlet matches the arrival time of a sample of the inlet')
+            return result.k[0]
+
+        #When the fit is done, k is written in the degradation line edit
+        self.startJob('calibrate',fitting,lambda k: self.degradation.setText('%g' % k))
+
+    #The saveResults method allows to save the results of the simulation (sample ID,
+    #measurement time, travel time, arrival time, concentrations at the inlet and at
+    #the outlet) to a csv file or to a folder of .npy files, one per column
+    #(write_results is a function of the pharmaceuticals.export module)
+    def saveResults(self, result):
+
+        #getSaveFileName returns the chosen path and the chosen filter (the format)
+        outputfile,selected=QFileDialog.getSaveFileName(self,"Save results (Cancel to skip)", "",
+                                                        'CSV files (*.csv);;NumPy column folders (*.npy)')
+        if not outputfile:
+            return
+        from pharmaceuticals.export import write_results
+        try:
+            write_results(outputfile,self.sample_id,self.date_time,self.inlet_conc,result,
+                          'npy' if selected.startswith('NumPy') else 'csv')
+        except OSError as error:
+            QMessageBox.question(self,'Error!',"Results not saved: "+str(error), QMessageBox.Ok)
+
+    #The plotResults method plots measured and simulated pharmaceuticals' concentrations
+    #once the simulation is done
+    def plotResults(self, results):
+
+        self.sample_id,self.date_time,self.inlet_conc,self.avg_velocity,result=results
+        #time_shift is an array containing the time shift of each sample at the inlet
+        time_shift=result.travel_time
+        #date_time_shifted is an array containing times from the array date_time
+        #shifted by the amounts contained in the array time_shift
+        date_time_shifted=result.arrival_time
+        #sim_conc is the array of simulated pharmaceuticals' concentration at the outlet
+        sim_conc=result.outlet_conc
+
+        #Saving results (before plotting, so that they are kept however the plots are closed)
+        self.saveResults(result)
 
         #Plotting results
 
-        #First plot: measured concentration vs times
+        #Importing the plotting modules (only the first time)
+        pyplot,dates=importPyplot()
+        from pharmaceuticals.plotting import ResponsiveSeries
 
-        #The x axis will contain values from the list date_time transformed
-        #in a datetime object
-        x_axis1=[]
-        #Iterating over the list date_time
-        for t in self.date_time:
-            #Updating the list x_axis (strptime is a method of the datetime
-            #class which allows to convert a string in a datetime object).
-            #By now, x_axis is nothing but a copy of date_time, but its
-            #elements are not strings (as in date_time) but datetime objects
-            x_axis1.append(datetime.strptime(t,'%Y-%m-%d %H:%M:%S'))
-        #The y axis will contain values from the list inlet_conc
-        #(ATTENTION: these values must be numbers NOT strings!)
-        y_axis1=[]
-        for y in self.inlet_conc:
-            y_axis1.append(float(y))
+        #Each series is drawn through a ResponsiveSeries (a class of the
+        #pharmaceuticals.plotting module), which draws only the points inside the
+        #current view, downsampled keeping the minimum and the maximum of each
+        #bucket, and annotates only some of the labels of the visible points.
+        #Zooming or panning the plot draws again the points and labels in view
 
-        #Setting the x axis
-        pyplot.gca().xaxis.set_major_formatter(dates.DateFormatter('%Y-%m-%d %H:%M:%S'))
+        #Each plot is drawn on axes of a new figure of its own (so that nothing is
+        #left over from the plot before)
+
+        #First plot: measured concentration vs times
+        axes=pyplot.figure().add_subplot(1,1,1)
 
-        #Plotting line
-        pyplot.plot(x_axis1,y_axis1,zorder=2)
+        #Setting the x axis
+        axes.xaxis.set_major_formatter(dates.DateFormatter('%Y-%m-%d %H:%M:%S'))
 
-        #Plotting also points (important: use the pyplot.plot first!)
-        pyplot.scatter(x_axis1,y_axis1,zorder=1)
+        #Plotting line and points
+        ResponsiveSeries(axes,self.date_time,self.inlet_conc)
 
         #Title and axis labels
-        pyplot.title(self.conc_inlet.currentText())
-        pyplot.xlabel("Time")
-        pyplot.ylabel(self.conc_inlet.currentText())
+        axes.set_title(self.conc_inlet.currentText())
+        axes.set_xlabel("Time")
+        axes.set_ylabel(self.conc_inlet.currentText())
 
         #Showing the plot
-        pyplot.gcf().autofmt_xdate()
+        axes.figure.autofmt_xdate()
         pyplot.show()
 
         #Second plot: simulated concentration vs times
-
-        #The x axis will contain values from the list date_time_shifted transformed
-        #in a datetime object
-        x_axis2=[]
-        #Iterating over the list date_time_shifted
-        for t in date_time_shifted:
-            #Updating the list x_axis (strptime is a method of the datetime
-            #class which allows to convert a string in a datetime object).
-            #By now, x_axis is nothing but a copy of date_time_shifted, but its
-            #elements are not strings (as in date_time) but datetime objects
-            x_axis2.append(datetime.strptime(t,'%Y-%m-%d %H:%M:%S'))
-        #The y axis will contain values from the list sim_conc
-        #(ATTENTION: these values must be numbers NOT strings!)
-        y_axis2=[]
-        for y in sim_conc:
-            y_axis2.append(float(y))
+        axes=pyplot.figure().add_subplot(1,1,1)
 
         #Setting the x axis
-        pyplot.gca().xaxis.set_major_formatter(dates.DateFormatter('%Y-%m-%d %H:%M:%S'))
+        axes.xaxis.set_major_formatter(dates.DateFormatter('%Y-%m-%d %H:%M:%S'))
 
-        #Plotting line
-        pyplot.plot(x_axis2,y_axis2,zorder=2)
-
-        #Plotting also points (important: use the pyplot.plot first!)
-        pyplot.scatter(x_axis2,y_axis2,zorder=1)
+        #Plotting line and points
+        ResponsiveSeries(axes,date_time_shifted,sim_conc)
 
         #Title and axis labels
-        pyplot.title(self.conc_inlet.currentText(),fontsize=32)
-        pyplot.xlabel("Time")
-        pyplot.ylabel(self.conc_inlet.currentText())
+        axes.set_title(self.conc_inlet.currentText(),fontsize=32)
+        axes.set_xlabel("Time")
+        axes.set_ylabel(self.conc_inlet.currentText())
 
         #Showing the plot
-        pyplot.gcf().autofmt_xdate()
+        axes.figure.autofmt_xdate()
         pyplot.show()
 
-        #Plotting two plots together
-        pyplot.plot(x_axis1, y_axis1, x_axis2, y_axis2, )
-
-        #Setting labels to plot points
-        labels=[]
-        for id in self.sample_id:
-            labels.append(id)
-        for i, label in enumerate(labels):
-            pyplot.annotate(label,(x_axis1[i],y_axis1[i]))
-            pyplot.annotate(label+'_out',(x_axis2[i],y_axis2[i]))
+        #Plotting two plots together, setting labels (sample IDs) to plot points
+        axes=pyplot.figure().add_subplot(1,1,1)
+        ResponsiveSeries(axes,self.date_time,self.inlet_conc,labels=self.sample_id,points=False,
+                         label='Concentration measured at the inlet')
+        ResponsiveSeries(axes,date_time_shifted,sim_conc,labels=self.sample_id,suffix='_out',points=False,
+                         label='Concentration simulated at the outlet')
 
         #Showing the legend
-        pyplot.gca().legend(('Concentration measured at the inlet','Concentration simulated at the outlet'))
+        axes.legend()
 
         #Showing the plot
         pyplot.show()